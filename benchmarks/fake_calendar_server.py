@@ -0,0 +1,326 @@
+#! /usr/bin/env python
+"""Local stand-in for the Google Calendar API v3, for end to end load and fault injection tests
+
+Serves calendarList.list, events.list (paging, syncToken, timeMin/timeMax, orderBy), events.insert,
+events.patch, events.delete, freebusy.query and batch requests over HTTP, on synthetic calendars
+(see synthetic.py). Latency, page size, request rate limit and random errors are configurable.
+
+gcaltools is pointed at it with GCALTOOLS_API_ROOT, it then uses dummy credentials:
+
+    python benchmarks/fake_calendar_server.py --calendars 3 --events 20000 --port 8080
+    HOME=$(mktemp -d) GCALTOOLS_API_ROOT=http://127.0.0.1:8080/ gcaltools report -a
+
+usage: python benchmarks/fake_calendar_server.py [--host HOST] [--port PORT] [--calendars N] [--events N]
+                                                 [--attendees N] [--page-size N] [--latency S] [--jitter S]
+                                                 [--rate-limit N] [--error-rate P] [--error-code CODE ...] [--seed N]
+"""
+import argparse
+import email.parser
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate_events  # noqa: E402
+
+SERVICE_PATH = '/calendar/v3/'
+BATCH_PATH = '/batch/calendar/v3'
+
+ERRORS = {
+    403: ('Rate Limit Exceeded', 'rateLimitExceeded', 'usageLimits'),
+    429: ('Too Many Requests', 'rateLimitExceeded', 'usageLimits'),
+    500: ('Backend Error', 'backendError', 'global'),
+    503: ('Service Unavailable', 'backendError', 'global'),
+}
+
+REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 409: 'Conflict',
+           410: 'Gone', 429: 'Too Many Requests', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str, reason: str = None, domain: str = 'global') -> None:
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': {'code': status, 'message': message, 'errors': [{'domain': domain, 'reason': reason or message, 'message': message}]}}
+
+
+def edge_moment(edge: dict) -> datetime:
+    """Start or end of an event as an aware datetime, all day events in UTC"""
+    if 'dateTime' in edge:
+        return datetime.fromisoformat(edge['dateTime'])
+    return datetime.fromisoformat(edge['date']).replace(tzinfo=timezone.utc)
+
+
+class Calendar:
+    """Events of a calendar with a change log: every change gets a sequence number, sync tokens are sequence numbers"""
+
+    def __init__(self, calendar_id: str, summary: str, events: list) -> None:
+        self.id = calendar_id
+        self.summary = summary
+        self.events = {}
+        self.changed = {}
+        self.sequence = 0
+        for event in events:
+            self.store(event)
+
+    def store(self, event: dict) -> None:
+        self.sequence += 1
+        event['updated'] = datetime.now(timezone.utc).isoformat()
+        self.events[event['id']] = event
+        self.changed[event['id']] = self.sequence
+
+
+class FakeCalendarApi:
+    """Calendar API requests handling, shared by all server threads"""
+
+    def __init__(self, calendars: list, page_size: int = 2500, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: float = None, error_rate: float = 0.0, error_codes=(403, 429, 500, 503), seed: int = 0) -> None:
+        self.calendars = {c.id: c for c in calendars}
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        # Token bucket of the request rate limit, one second worth of requests
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+
+    def __calendar(self, calendar_id: str) -> Calendar:
+        calendar = self.calendars.get(calendar_id)
+        if calendar is None:
+            raise ApiError(404, 'Not Found', 'notFound')
+        return calendar
+
+    def __check_quota(self) -> None:
+        """Counts a request, raises injected or rate limit errors. Called with _lock held"""
+        self.requests += 1
+        if self.rate_limit is not None:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+            self._refilled = now
+            if self._tokens < 1:
+                self.errors += 1
+                raise ApiError(403, *ERRORS[403])
+            self._tokens -= 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            status = self.random.choice(self.error_codes)
+            raise ApiError(status, *ERRORS.get(status, ('Error', 'backendError', 'global')))
+
+    def handle(self, method: str, url: str, body: bytes) -> tuple:
+        """Returns (status, response body) of an API request"""
+        parts = urlsplit(url)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        path = parts.path
+        try:
+            with self._lock:
+                self.__check_quota()
+                payload = json.loads(body) if body else {}
+                return self.__route(method, path, query, payload)
+        except ApiError as error:
+            return error.status, error.body
+        except (ValueError, KeyError) as error:
+            return 400, ApiError(400, 'Bad Request: {}'.format(error), 'badRequest').body
+
+    def __route(self, method: str, path: str, query: dict, payload: dict) -> tuple:
+        if not path.startswith(SERVICE_PATH):
+            raise ApiError(404, 'Not Found', 'notFound')
+        route = path[len(SERVICE_PATH):]
+        if method == 'GET' and route == 'users/me/calendarList':
+            return 200, {'items': [{'id': c.id, 'summary': c.summary, 'timeZone': 'Europe/Brussels', 'accessRole': 'owner'} for c in self.calendars.values()]}
+        if method == 'POST' and route == 'freeBusy':
+            return 200, self.__free_busy(payload)
+        match = re.fullmatch(r'calendars/([^/]+)/events(?:/([^/]+))?', route)
+        if match is None:
+            raise ApiError(404, 'Not Found', 'notFound')
+        calendar = self.__calendar(unquote(match.group(1)))
+        event_id = unquote(match.group(2)) if match.group(2) else None
+        if event_id is None and method == 'GET':
+            return 200, self.__list(calendar, query)
+        if event_id is None and method == 'POST':
+            return 200, self.__insert(calendar, payload)
+        event = calendar.events.get(event_id)
+        if event is None:
+            raise ApiError(404, 'Not Found', 'notFound')
+        if event['status'] == 'cancelled':
+            raise ApiError(410, 'Resource has been deleted', 'deleted')
+        if method == 'GET':
+            return 200, event
+        if method == 'PATCH':
+            patched = dict(event)
+            patched.update(payload, id=event_id)
+            calendar.store(patched)
+            return 200, calendar.events[event_id]
+        if method == 'DELETE':
+            calendar.store(dict(event, status='cancelled'))
+            return 204, None
+        raise ApiError(400, 'Bad Request', 'badRequest')
+
+    def __list(self, calendar: Calendar, query: dict) -> dict:
+        sync_token = query.get('syncToken')
+        if sync_token is not None:
+            if not sync_token.isdigit() or int(sync_token) > calendar.sequence:
+                raise ApiError(410, 'Sync token is no longer valid, a full sync is required.', 'fullSyncRequired')
+            # Changes since the token, deleted events included
+            items = [calendar.events[i] for i, sequence in calendar.changed.items() if sequence > int(sync_token)]
+        else:
+            items = [e for e in calendar.events.values() if e['status'] != 'cancelled']
+            if 'timeMin' in query:
+                time_min = datetime.fromisoformat(query['timeMin'])
+                items = [e for e in items if edge_moment(e['end']) > time_min]
+            if 'timeMax' in query:
+                time_max = datetime.fromisoformat(query['timeMax'])
+                items = [e for e in items if edge_moment(e['start']) < time_max]
+            if query.get('orderBy') == 'startTime':
+                items.sort(key=lambda e: edge_moment(e['start']))
+
+        offset = int(query.get('pageToken', 0))
+        size = min(int(query.get('maxResults', 250)), self.page_size)
+        page = {'kind': 'calendar#events', 'items': items[offset:offset + size]}
+        if offset + size < len(items):
+            page['nextPageToken'] = str(offset + size)
+        else:
+            page['nextSyncToken'] = str(calendar.sequence)
+        return page
+
+    def __insert(self, calendar: Calendar, payload: dict) -> dict:
+        event = dict(payload)
+        event.setdefault('id', uuid.uuid4().hex)
+        if event['id'] in calendar.events:
+            raise ApiError(409, 'The requested identifier already exists.', 'duplicate')
+        event.setdefault('iCalUID', '{}@fake'.format(event['id']))
+        event.setdefault('status', 'confirmed')
+        calendar.store(event)
+        return event
+
+    def __free_busy(self, payload: dict) -> dict:
+        time_min = datetime.fromisoformat(payload['timeMin'])
+        time_max = datetime.fromisoformat(payload['timeMax'])
+        calendars = {}
+        for item in payload.get('items', []):
+            if item['id'] in self.calendars:
+                events = [e for e in self.calendars[item['id']].events.values()]
+            else:
+                # Attendee email: events of every calendar the attendee did not decline
+                events = [e for c in self.calendars.values() for e in c.events.values()
+                          if any(a['email'] == item['id'] and a.get('responseStatus') != 'declined' for a in e.get('attendees', []))]
+            busy = sorted((edge_moment(e['start']), edge_moment(e['end'])) for e in events if e['status'] != 'cancelled')
+            calendars[item['id']] = {'busy': [{'start': s.isoformat(), 'end': e.isoformat()} for s, e in busy if e > time_min and s < time_max]}
+        return {'kind': 'calendar#freeBusy', 'timeMin': payload['timeMin'], 'timeMax': payload['timeMax'], 'calendars': calendars}
+
+    def delay(self) -> None:
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.random() * self.jitter)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def __body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def __send(self, status: int, body: bytes, content_type: str = 'application/json; charset=UTF-8') -> None:
+        self.send_response(status, REASONS.get(status))
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __handle(self):
+        api = self.server.api
+        body = self.__body()
+        api.delay()
+        if self.command == 'POST' and urlsplit(self.path).path == BATCH_PATH:
+            boundary, content = self.__batch(body)
+            return self.__send(200, content, 'multipart/mixed; boundary={}'.format(boundary))
+        status, response = api.handle(self.command, self.path, body)
+        self.__send(status, json.dumps(response).encode() if response is not None else b'')
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = __handle
+
+    def __batch(self, body: bytes) -> tuple:
+        """Runs the sub-requests of a multipart/mixed batch, returns (boundary, multipart response)"""
+        message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+        boundary = 'batch_{}'.format(uuid.uuid4().hex)
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload(decode=True) or part.get_payload().encode()
+            head, _, sub_body = request.replace(b'\r\n', b'\n').partition(b'\n\n')
+            method, url, _ = head.split(b'\n', 1)[0].decode().split(' ', 2)
+            status, response = self.server.api.handle(method, url, sub_body.strip())
+            content_id = part['Content-ID'].strip('<>')
+            response_body = json.dumps(response) if response is not None else ''
+            parts.append('--{}\r\nContent-Type: application/http\r\nContent-ID: <response-{}>\r\n\r\nHTTP/1.1 {} {}\r\nContent-Type: application/json; charset=UTF-8\r\nContent-Length: {}\r\n\r\n{}\r\n'.format(
+                boundary, content_id, status, REASONS.get(status, ''), len(response_body.encode()), response_body))
+        return boundary, (''.join(parts) + '--{}--\r\n'.format(boundary)).encode()
+
+
+def synthetic_calendars(count: int, events: int, attendees: int, seed: int) -> list:
+    calendars = []
+    for i in range(count):
+        calendar_events = generate_events(events, attendees=attendees, seed=seed + i)
+        for event in calendar_events:
+            # Ids are unique per calendar, iCalUIDs over all calendars
+            event['iCalUID'] = 'cal{}-{}'.format(i, event['iCalUID'])
+        calendars.append(Calendar('cal{}@fake'.format(i), 'Calendar {}'.format(i), calendar_events))
+    return calendars
+
+
+def serve(api: FakeCalendarApi, host: str = '127.0.0.1', port: int = 8080) -> ThreadingHTTPServer:
+    """Returns started server (port 0: any free port, see server.server_address), stop it with shutdown()"""
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Google Calendar API v3')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--calendars', type=int, default=2, help="Synthetic calendars (default: 2)")
+    parser.add_argument('--events', type=int, default=1000, help="Events per calendar (default: 1000)")
+    parser.add_argument('--attendees', type=int, default=50, help="Distinct attendees (default: 50)")
+    parser.add_argument('--page-size', type=int, default=2500, help="Maximum events per page (default: 2500, like the API)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay of every HTTP request, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra delay, up to this many seconds")
+    parser.add_argument('--rate-limit', type=float, help="Requests per second (batch sub-requests included) before 403 rateLimitExceeded")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failing at random")
+    parser.add_argument('--error-code', type=int, action='append', choices=sorted(ERRORS), help="Status of random errors, repeat for several (default: all)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    api = FakeCalendarApi(synthetic_calendars(args.calendars, args.events, args.attendees, args.seed), page_size=args.page_size,
+                          latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, error_rate=args.error_rate,
+                          error_codes=args.error_code or sorted(ERRORS), seed=args.seed)
+    server = serve(api, args.host, args.port)
+    print('Fake Calendar API listening on http://{}:{}/'.format(*server.server_address[:2]))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    print('{} requests served, {} errors injected'.format(api.requests, api.errors))
+
+
+if __name__ == '__main__':
+    main()
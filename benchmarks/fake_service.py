@@ -0,0 +1,111 @@
+"""In-process stand-in for the Calendar API service object
+
+Replaces GoogleCalendarManager._service: requests are answered from memory, without HTTP,
+so benchmarks only measure gcaltools' own processing.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+import yaml
+
+from gcaltools.event_store import EventStore
+from gcaltools.gcal_api import GoogleCalendarManager
+
+
+class FakeRequest:
+    def __init__(self, method_id: str, run) -> None:
+        self.methodId = method_id
+        self._run = run
+
+    def execute(self, http=None, num_retries=0):
+        return self._run()
+
+
+class FakeBatch:
+    def __init__(self, callback) -> None:
+        self._callback = callback
+        self._requests = {}
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests[request_id or str(len(self._requests))] = request
+
+    def execute(self, http=None):
+        for request_id, request in self._requests.items():
+            self._callback(request_id, request.execute(), None)
+
+
+class FakeEvents:
+    def __init__(self, calendars: dict) -> None:
+        self._calendars = calendars
+
+    def list(self, calendarId=None, pageToken=None, maxResults=250, syncToken=None, **kwargs):
+        def run():
+            # Sync requests get every event, then an empty delta
+            items = [] if syncToken else self._calendars[calendarId]
+            offset = int(pageToken or 0)
+            page = {'items': items[offset:offset + maxResults]}
+            if offset + maxResults < len(items):
+                page['nextPageToken'] = str(offset + maxResults)
+            else:
+                page['nextSyncToken'] = 'synthetic'
+            return page
+        return FakeRequest('calendar.events.list', run)
+
+    def insert(self, calendarId=None, body=None, **kwargs):
+        def run():
+            self._calendars[calendarId].append(body)
+            return {'id': body.get('id')}
+        return FakeRequest('calendar.events.insert', run)
+
+
+class FakeCalendarList:
+    def __init__(self, calendars: dict) -> None:
+        self._calendars = calendars
+
+    def list(self, pageToken=None, **kwargs):
+        return FakeRequest('calendar.calendarList.list', lambda: {'items': [{'id': c, 'summary': c, 'timeZone': 'Europe/Brussels'} for c in self._calendars]})
+
+
+class FakeService:
+    """Calendar service answering calendarList.list, events.list (with paging and syncToken), events.insert and batches"""
+
+    def __init__(self, calendars: dict) -> None:
+        self.calendars = calendars
+        self._events = FakeEvents(calendars)
+        self._calendar_list = FakeCalendarList(calendars)
+
+    def events(self):
+        return self._events
+
+    def calendarList(self):
+        return self._calendar_list
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(callback)
+
+
+class NullPool:
+    """HTTP transports pool of the fake service, which needs none"""
+    size = 8
+
+    @contextmanager
+    def connection(self):
+        yield None
+
+
+def fake_manager(calendars: dict, work_dir: str = None, time_zone: str = 'Europe/Brussels') -> GoogleCalendarManager:
+    """Returns a GoogleCalendarManager served by a FakeService, with preferences and event store in work_dir
+    calendars:  {calendar name: [events resources]}, calendar ids are their names
+    """
+    work_dir = work_dir if work_dir is not None else tempfile.mkdtemp(prefix='gcaltools-bench-')
+    defaults_file_path = os.path.join(work_dir, 'defaults.yaml')
+    with open(defaults_file_path, 'w') as defaults_file:
+        yaml.dump({'default_calendar': next(iter(calendars)), 'default_duration': 60, 'default_timezone': time_zone, 'attendees_catalog': None}, defaults_file)
+
+    GoogleCalendarManager.defaults_file_path = defaults_file_path
+    manager = GoogleCalendarManager(use_api=False)
+    manager._service = FakeService(calendars)
+    manager._http_pool = NullPool()
+    manager._event_store = EventStore(os.path.join(work_dir, 'events.db'))
+    return manager
@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+"""Benchmarks of gcaltools event processing hot paths on synthetic calendars
+
+Each hot path runs on the same deterministic events (see synthetic.py), served by an in-process
+fake Calendar service (see fake_service.py). Throughput is the best of --repeat runs, peak memory
+is traced in one more run. Results are saved as JSON in benchmarks/results/, named after the
+current commit, and can be compared with a previous run.
+
+usage: python benchmarks/run_benchmarks.py [--events N] [--attendees N] [--all-day RATIO]
+                                           [--time-zone TZ ...] [--no-colors] [--seed N]
+                                           [--only NAME ...] [--repeat N] [--no-memory]
+                                           [--save] [--compare RESULTS_FILE]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from pytz import timezone  # noqa: E402
+
+from gcaltools.conflicts import AttendeeIntervalIndex  # noqa: E402
+from gcaltools.events import Event  # noqa: E402
+from gcaltools.reporter import generate_report, report_hours  # noqa: E402
+from gcaltools.summary import METRICS, Summary  # noqa: E402
+
+from fake_service import fake_manager  # noqa: E402
+from synthetic import events_span, generate_events  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+CALENDAR = 'Synthetic'
+TIME_ZONE = 'Europe/Brussels'
+
+# rich tables grow slower than linearly, only the first events are rendered
+RENDER_MAX_EVENTS = 5000
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Registers a hot path: function(context) running it once, returning the number of items processed"""
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class Context:
+    """Data shared by benchmarks, prepared before any of them is timed"""
+
+    def __init__(self, raw_events: list, work_dir: str) -> None:
+        self.raw_events = raw_events
+        self.work_dir = work_dir
+        self.time_zone = timezone(TIME_ZONE)
+        self.events = sorted((Event.from_api(e, self.time_zone) for e in raw_events), key=lambda e: e.start)
+        first_day, last_day = events_span(raw_events)
+        self.start_date = datetime(first_day.year, first_day.month, first_day.day)
+        self.end_date = datetime(last_day.year, last_day.month, last_day.day, 23, 59, 59)
+        self.manager = fake_manager({CALENDAR: raw_events}, work_dir, TIME_ZONE)
+        self.manager.sync_events(CALENDAR)
+
+
+@benchmark('parse')
+def bench_parse(context):
+    return len([Event.from_api(e, context.time_zone) for e in context.raw_events])
+
+
+@benchmark('sync')
+def bench_sync(context):
+    context.manager.sync_events(CALENDAR, full=True)
+    return len(context.raw_events)
+
+
+@benchmark('read')
+def bench_read(context):
+    return sum(1 for _ in context.manager.iter_stored_events(CALENDAR, offline=True))
+
+
+@benchmark('search')
+def bench_search(context):
+    return sum(1 for _ in context.manager.search_stored_events([CALENDAR], 'python'))
+
+
+@benchmark('aggregate')
+def bench_aggregate(context):
+    report_hours(context.events, start_date=context.start_date, end_date=context.end_date, time_zone=TIME_ZONE)
+    return len(context.events)
+
+
+def report(context, output_format: str) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_report(output_format, {CALENDAR: context.events}, os.path.join(context.work_dir, 'report'),
+                        start_date=context.start_date, end_date=context.end_date, time_zone=TIME_ZONE)
+    return len(context.events)
+
+
+@benchmark('report.xlsx')
+def bench_report_xlsx(context):
+    return report(context, 'xlsx')
+
+
+@benchmark('report.csv')
+def bench_report_csv(context):
+    return report(context, 'csv')
+
+
+@benchmark('summary')
+def bench_summary(context):
+    Summary(list(METRICS), TIME_ZONE, 'month').add_events(context.events).results()
+    return len(context.events)
+
+
+@benchmark('conflicts')
+def bench_conflicts(context):
+    index = AttendeeIntervalIndex()
+    index.add_events(CALENDAR, context.events)
+    for _ in index.conflicts():
+        pass
+    return len(context.events)
+
+
+@benchmark('render')
+def bench_render(context):
+    from gcaltools.printer import events_printer
+    events = context.events[:RENDER_MAX_EVENTS]
+    with contextlib.redirect_stdout(io.StringIO()):
+        events_printer(events)
+    return len(events)
+
+
+def run_benchmark(function, context, repeat: int, memory: bool) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = function(context)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    result = {'items': items, 'seconds': best, 'items_per_second': items / best if best else None}
+    if memory:
+        tracemalloc.start()
+        function(context)
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    print('{:<12} {:>9} {:>10} {:>14} {:>10}{}'.format('benchmark', 'items', 'time (s)', 'items/s', 'peak MiB', '  vs baseline' if baseline else ''))
+    for name, result in results.items():
+        peak = '{:.1f}'.format(result['peak_bytes'] / 1024 / 1024) if 'peak_bytes' in result else '-'
+        line = '{:<12} {:>9} {:>10.4f} {:>14,.0f} {:>10}'.format(name, result['items'], result['seconds'], result['items_per_second'] or 0, peak)
+        if baseline and name in baseline['results']:
+            # Above 1.00: slower than the baseline
+            line += '  {:>10.2f}x'.format(result['seconds'] / baseline['results'][name]['seconds'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of gcaltools hot paths on synthetic calendars')
+    parser.add_argument('--events', type=int, default=10000, help="Synthetic events count (default: 10000)")
+    parser.add_argument('--attendees', type=int, default=50, help="Distinct attendees (default: 50)")
+    parser.add_argument('--all-day', type=float, default=0.1, help="Share of all day events (default: 0.1)")
+    parser.add_argument('--time-zone', action='append', help="Time zone of timed events, repeat for several (default: Europe/Brussels)")
+    parser.add_argument('--no-colors', action='store_true', help="No colorId on events")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument('--only', action='append', choices=list(BENCHMARKS), help="Run this benchmark only, repeat for several")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark, the best one is kept (default: 3)")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the peak memory run")
+    parser.add_argument('--save', action='store_true', help="Save results in benchmarks/results/")
+    parser.add_argument('--compare', metavar='RESULTS_FILE', help="Compare with previously saved results")
+    args = parser.parse_args()
+
+    params = {
+        'events': args.events,
+        'attendees': args.attendees,
+        'all_day_ratio': args.all_day,
+        'time_zones': args.time_zone or ['Europe/Brussels'],
+        'colors': not args.no_colors,
+        'seed': args.seed,
+    }
+    raw_events = generate_events(args.events, params['attendees'], params['all_day_ratio'], params['time_zones'], params['colors'], seed=params['seed'])
+
+    with tempfile.TemporaryDirectory(prefix='gcaltools-bench-') as work_dir:
+        context = Context(raw_events, work_dir)
+        results = {name: run_benchmark(BENCHMARKS[name], context, args.repeat, not args.no_memory) for name in (args.only or BENCHMARKS)}
+
+    run = {
+        'commit': current_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': params,
+        'results': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['params'] != params:
+            print('WARNING: baseline was run with other parameters: {}'.format(baseline['params']))
+    print_results(results, baseline)
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        results_path = os.path.join(RESULTS_DIR, '{}-{}.json'.format(run['commit'], args.events))
+        with open(results_path, 'w') as results_file:
+            json.dump(run, results_file, indent=2)
+        print('Results saved to {}'.format(results_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Deterministic synthetic calendars for benchmarks
+
+Events look like Calendar API v3 events resources (the fields gcaltools requests, see config.EVENT_FIELDS).
+The same parameters and seed always give the same events.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import pytz
+
+from gcaltools.config import COLORS
+
+TITLES = ['Python', 'Linux', 'Networking', 'Security', 'Databases', 'Cloud', 'Git', 'Docker', 'Kubernetes', 'Ansible']
+START_TIMES = [(9, 0), (10, 30), (13, 30), (15, 0)]
+
+
+def attendee_emails(count: int) -> list:
+    return ['trainer{:05d}@example.com'.format(i) for i in range(count)]
+
+
+def generate_events(count: int, attendees: int = 50, all_day_ratio: float = 0.1, time_zones=('Europe/Brussels',),
+                    colors: bool = True, max_attendees: int = 3, first_day: date = date(2024, 1, 1), seed: int = 0) -> list:
+    """Returns count events resources spread over working days from first_day (a monday)
+    attendees:      attendee emails cardinality
+    all_day_ratio:  share of all day events
+    time_zones:     time zones of timed events start and end, picked at random
+    colors:         set a colorId on half of the events
+    max_attendees:  attendees per event, from 0 to max_attendees
+    """
+    rng = random.Random(seed)
+    emails = attendee_emails(attendees)
+    zones = [pytz.timezone(name) for name in time_zones]
+    color_ids = list(COLORS.values())
+    # About four events per working day
+    days = max(1, count // 4)
+    events = []
+    for i in range(count):
+        working_day = rng.randrange(days)
+        day = first_day + timedelta(weeks=working_day // 5, days=working_day % 5)
+        event = {
+            'id': 'evt{:07d}'.format(i),
+            'iCalUID': 'evt{:07d}@synthetic'.format(i),
+            'status': 'confirmed',
+            'summary': '{} {}'.format(rng.choice(TITLES), rng.randrange(1, 4)),
+            'description': 'Synthetic event {} of {}'.format(i, count),
+        }
+        if rng.random() < all_day_ratio:
+            event['start'] = {'date': day.isoformat()}
+            event['end'] = {'date': (day + timedelta(days=1)).isoformat()}
+        else:
+            zone = rng.choice(zones)
+            hour, minute = rng.choice(START_TIMES)
+            start = zone.localize(datetime(day.year, day.month, day.day, hour, minute))
+            end = start + timedelta(minutes=rng.choice([60, 90, 180, 210]))
+            event['start'] = {'dateTime': start.isoformat(), 'timeZone': zone.zone}
+            event['end'] = {'dateTime': end.isoformat(), 'timeZone': zone.zone}
+        if attendees:
+            event_attendees = rng.sample(emails, rng.randint(0, min(max_attendees, attendees)))
+            if event_attendees:
+                event['attendees'] = [{'email': email, 'responseStatus': rng.choice(['accepted', 'accepted', 'needsAction', 'declined'])} for email in event_attendees]
+        if colors and rng.random() < 0.5:
+            event['colorId'] = str(rng.choice(color_ids))
+        events.append(event)
+    return events
+
+
+def events_span(events: list) -> tuple:
+    """Returns (first, last) day covered by events"""
+    days = [datetime.fromisoformat(e['start'].get('dateTime', e['start'].get('date'))).date() for e in events]
+    return min(days), max(days)
@@ -0,0 +1,76 @@
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from pytz import timezone
+
+from gcaltools.events import ATTENDEES
+
+
+class AttendeeHours:
+    """Hours per day and attendee over a date range
+    Interned attendee ids of events are mapped to dense column ids and hours accumulate in a days x attendees matrix.
+    Events are split at day boundaries of the given time zone.
+    """
+
+    def __init__(self, first_day: date, last_day: date, time_zone: str) -> None:
+        self.first_day = first_day
+        self.days_count = (last_day - first_day).days + 1
+        self.time_zone = timezone(time_zone)
+        # POSIX timestamps of each day start in the time zone, plus the end of the last day
+        self._midnights = [self.time_zone.localize(datetime.combine(first_day + timedelta(days=d), time.min)).timestamp() for d in range(self.days_count + 1)]
+        self.attendees = []
+        self._columns = {}
+        # Rows only grow up to the highest attendee id seen on that day, missing cells are 0
+        self._rows = [[] for _ in range(self.days_count)]
+
+    def attendee_id(self, attendee: int) -> int:
+        """Returns column id of an interned attendee, registering it on first use"""
+        column = self._columns.get(attendee)
+        if column is None:
+            column = self._columns[attendee] = len(self.attendees)
+            self.attendees.append(ATTENDEES.email(attendee))
+        return column
+
+    def add_hours(self, day_index: int, attendee_ids, hours: float) -> None:
+        if not 0 <= day_index < self.days_count:
+            return
+        row = self._rows[day_index]
+        for attendee_id in attendee_ids:
+            if attendee_id >= len(row):
+                row.extend([0] * (attendee_id + 1 - len(row)))
+            row[attendee_id] += hours
+
+    def add_event(self, event) -> None:
+        """Accumulate hours of a timed event for each of its attendees, all day events are ignored"""
+        if event.all_day or not event.attendees:
+            return
+        attendee_ids = [self.attendee_id(a) for a in event.attendees]
+        start = event.start.timestamp()
+        end = event.end.timestamp()
+
+        # Index -1 is the time before the first day, segments outside of the range are ignored
+        day_index = bisect_right(self._midnights, start) - 1
+        while start < end and day_index < self.days_count:
+            segment_end = min(end, self._midnights[day_index + 1])
+            self.add_hours(day_index, attendee_ids, (segment_end - start) / 3600)
+            start = segment_end
+            day_index += 1
+
+    def day(self, day_index: int) -> date:
+        return self.first_day + timedelta(days=day_index)
+
+    def row(self, day_index: int, attendee_ids) -> list:
+        """Returns hours of given attendees on given day"""
+        row = self._rows[day_index]
+        return [row[a] if a < len(row) else 0 for a in attendee_ids]
+
+    def sorted_attendee_ids(self) -> list:
+        """Returns attendee ids sorted by email"""
+        return sorted(range(len(self.attendees)), key=lambda a: self.attendees[a])
+
+
+def aggregate_hours(event_list, first_day: date, last_day: date, time_zone: str) -> AttendeeHours:
+    """Returns hours per day and attendee of events between first_day and last_day (included)"""
+    hours = AttendeeHours(first_day, last_day, time_zone)
+    for event in event_list:
+        hours.add_event(event)
+    return hours
@@ -0,0 +1,40 @@
+import threading
+from collections import OrderedDict
+
+from googleapiclient.model import JsonModel
+
+from gcaltools.config import DECODED_CACHE_MAX_ENTRIES
+from gcaltools.http_cache import ResponseCache
+
+
+class CachedJsonModel(JsonModel):
+    """JSON model reusing already decoded bodies for responses revalidated by the cache (HTTP 304)
+    Only responses the on-disk cache keeps are memorized, by URL and ETag, up to max_entries.
+    Memorized bodies are shared by every request revalidating them: callers must not modify them.
+    """
+
+    def __init__(self, data_wrapper: bool = False, max_entries: int = DECODED_CACHE_MAX_ENTRIES) -> None:
+        super().__init__(data_wrapper=data_wrapper)
+        self.max_entries = max_entries
+        self._decoded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def response(self, resp, content):
+        etag = resp.get('etag')
+        url = resp.get('content-location')
+        if etag is None or url is None or any(parameter in url for parameter in ResponseCache.uncached_parameters):
+            return super().response(resp, content)
+        key = (url, etag)
+        if getattr(resp, 'fromcache', False):
+            with self._lock:
+                body = self._decoded.get(key)
+                if body is not None:
+                    self._decoded.move_to_end(key)
+                    return body
+        body = super().response(resp, content)
+        with self._lock:
+            self._decoded[key] = body
+            self._decoded.move_to_end(key)
+            while len(self._decoded) > self.max_entries:
+                self._decoded.popitem(last=False)
+        return body
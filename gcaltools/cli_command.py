@@ -1,35 +1,52 @@
-import os.path
+import csv
+import time
 
 import yaml
 
-from gcaltools.printer import calendar_list_printer, default_printer, events_printer, summary_printer, templates_printer
-from gcaltools.reporter import xlsx_report
 from datetime import datetime, timedelta
 from calendar import monthrange
-from gcaltools.config import COLORS, PERIODS
+from contextlib import nullcontext
+from gcaltools.config import PERIODS, PREFETCH_MAX_AGE
+from gcaltools import profiler
+from gcaltools.jobs import current_job
 from os import path
-from yaml import load, Loader
+from yaml import Loader
+from gcaltools.utils import YamlFile
+
+# Printing and reporting modules (rich, xlsxwriter) are imported by the commands using them
+
+
+def current_week() -> tuple:
+    """Returns (first, last) moments of the week displayed by show -w"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    min_time = today - timedelta(days=today.weekday())
+    return min_time, min_time + timedelta(days=6)
+
+
+def current_month() -> tuple:
+    """Returns (first, last) moments of the month displayed by show -m"""
+    min_time = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return min_time, min_time.replace(day=monthrange(min_time.year, min_time.month)[1], hour=23, minute=59, second=59)
 
 
 class CliCommand:
     def __init__(self, calendar_manager):
         self._calendar_manager = calendar_manager
         self._template_file = path.expanduser('~') + '/.gcaltools/templates.yaml'
+        # Parsed once per session, parsed again when the file changes
+        self._templates = YamlFile(self._template_file, Loader)
+        # Prefetched events of the interactive mode: {(calendar, time_min, time_max): (events, monotonic time)}
+        self._warm_events = {}
+        self._warm_generation = 0
 
     @property
     def calendar_manager(self):
         return self._calendar_manager
 
-    def __load_template(self, template: str):
-        if path.exists(self._template_file):
+    def __load_templates(self) -> dict:
+        if self._templates.exists():
             try:
-                with open(self._template_file) as f:
-                    templates = load(f, Loader=Loader)
-                    if template in templates.keys():
-                        return templates[template]
-                    else:
-                        print('ERROR: Template {} not found in {}!'.format(template, self._template_file))
-                        exit()
+                return self._templates.load({})
             except yaml.YAMLError:
                 print("ERROR: Unable to parse {}".format(self._template_file))
                 exit()
@@ -37,25 +54,122 @@ class CliCommand:
             print("ERROR: template file {} not found!".format(self._template_file))
             exit()
 
-    # Execute CLI command
-    def execute_cmd(self, cli_command: str, command_args):
-        if cli_command == 'add':
-            self.__command_add(command_args)
-        elif cli_command == 'default':
-            self.__command_default(command_args)
-        elif cli_command == 'list':
-            self.__command_list()
-        elif cli_command == 'report':
-            self.__command_report(command_args)
-        elif cli_command == 'show':
-            self.__command_show(command_args)
-        elif cli_command == 'summary':
-            self.__command_summary(command_args)
-        elif cli_command == 'template':
-            self.__command_template(command_args)
+    def __load_template(self, template: str):
+        templates = self.__load_templates()
+        if template in templates.keys():
+            return templates[template]
         else:
+            print('ERROR: Template {} not found in {}!'.format(template, self._template_file))
+            exit()
+
+    def template_names(self) -> list:
+        """Names of available templates, for completions"""
+        try:
+            return sorted(self._templates.load({}))
+        except (OSError, yaml.YAMLError):
+            return []
+
+    def known_attendees(self) -> list:
+        """Emails of attendees found in the attendees catalog and templates, for completions"""
+        from gcaltools.reporter import load_attendees
+        emails = set()
+        try:
+            for template in self._templates.load({}).values():
+                emails.update(template.get('attendees') or [])
+            if self.calendar_manager.attendees_catalog is not None:
+                emails.update(load_attendees(self.calendar_manager.attendees_catalog))
+        except (OSError, yaml.YAMLError):
+            pass
+        return sorted(emails)
+
+    def prefetch(self) -> None:
+        """Syncs default calendar and keeps its current week and month events in memory, for show -w / -m
+        Best effort: meant to run in the background of the interactive mode, errors are ignored.
+        """
+        calendar_name = self.calendar_manager.default_calendar
+        if calendar_name is None:
+            return
+        generation = self._warm_generation
+        try:
+            self.calendar_manager.sync_events(calendar_name)
+            for time_min, time_max in (current_week(), current_month()):
+                events = list(self.__stored_events(calendar_name, time_min, time_max))
+                # Events fetched before a command changed them are dropped
+                if generation == self._warm_generation:
+                    self._warm_events[(calendar_name, time_min, time_max)] = (events, time.monotonic())
+        except Exception:
             pass
 
+    def prefetch_age(self) -> float or None:
+        """Seconds since the last prefetch, None if nothing is prefetched"""
+        if not self._warm_events:
+            return None
+        return time.monotonic() - max(fetched for _, fetched in list(self._warm_events.values()))
+
+    def __warm_events(self, calendar_name: str, time_min, time_max):
+        """Returns prefetched events if they are recent enough, else None"""
+        events, fetched = self._warm_events.get((calendar_name, time_min, time_max), (None, 0))
+        if events is None or time.monotonic() - fetched > PREFETCH_MAX_AGE:
+            return None
+        return events
+
+    def __get_events(self, calendar_name: str, time_min, time_max, command_args):
+        if not command_args.refresh:
+            events = self.__warm_events(calendar_name, time_min, time_max)
+            if events is not None:
+                return events
+        return self.calendar_manager.iter_stored_events(calendar_name, time_min=time_min, time_max=time_max, refresh=command_args.refresh, offline=command_args.offline)
+
+    # Execute CLI command
+    def execute_cmd(self, cli_command: str, command_args):
+        # Preferences edited outside of this session are read again
+        self.calendar_manager.refresh_user_preferences()
+
+        with profiler.phase('command {}'.format(cli_command)):
+            if cli_command == 'add':
+                self.__command_add(command_args)
+            elif cli_command == 'cache':
+                self.__command_cache(command_args)
+            elif cli_command == 'conflicts':
+                self.__command_conflicts(command_args)
+            elif cli_command == 'default':
+                self.__command_default(command_args)
+            elif cli_command == 'find-slot':
+                self.__command_find_slot(command_args)
+            elif cli_command == 'import':
+                self.__command_import(command_args)
+            elif cli_command == 'list':
+                self.__command_list()
+            elif cli_command == 'report':
+                self.__command_report(command_args)
+            elif cli_command == 'search':
+                self.__command_search(command_args)
+            elif cli_command == 'show':
+                self.__command_show(command_args)
+            elif cli_command == 'summary':
+                self.__command_summary(command_args)
+            elif cli_command == 'template':
+                self.__command_template(command_args)
+            elif cli_command == 'remoteauth':
+                self.calendar_manager.authenticate()
+            else:
+                pass
+
+        if cli_command in ('add', 'cache', 'default', 'import'):
+            # Events or default calendar may have changed
+            self._warm_generation += 1
+            self._warm_events.clear()
+
+        if self.calendar_manager.traffic is not None:
+            self.__print_traffic(cli_command)
+
+    def __print_traffic(self, cli_command: str) -> None:
+        traffic = self.calendar_manager.traffic
+        saved = traffic.payload_bytes - traffic.wire_bytes
+        print('DEBUG: {}: {} API responses ({} from cache), {:.1f} KiB of JSON, ~{:.1f} KiB transferred, ~{:.1f} KiB saved by gzip and cache'.format(
+            cli_command, traffic.responses, traffic.cached, traffic.payload_bytes / 1024, traffic.wire_bytes / 1024, saved / 1024))
+        traffic.reset()
+
     # gcaltools ADD command
     def __command_add(self, command_args):
 
@@ -98,20 +212,134 @@ class CliCommand:
         if command_args.title:
             title = command_args.title
 
+        start_times = []
         if command_args.start:
-            self.calendar_manager.insert_event(active_calendar, title, command_args.start_date, command_args.start, duration, attendees, color_name)
+            start_times.append(command_args.start)
 
         if command_args.full:
-            for p in PERIODS:
-                time = datetime.strptime(PERIODS[p], "%H:%M")
-                self.calendar_manager.insert_event(active_calendar, title, command_args.start_date, time, duration, attendees, color_name)
+            start_times += [datetime.strptime(PERIODS[p], "%H:%M") for p in PERIODS]
+
+        if command_args.check_conflicts:
+            bodies = [self.calendar_manager.event_body(title, command_args.start_date, time, duration, attendees, color_name) for time in start_times]
+            if self.__has_conflicts(bodies):
+                print('ERROR: attendees already booked, no event created.')
+                exit()
+
+        if len(start_times) == 1:
+            self.calendar_manager.insert_event(active_calendar, title, command_args.start_date, start_times[0], duration, attendees, color_name)
+        else:
+            bodies = [self.calendar_manager.event_body(title, command_args.start_date, time, duration, attendees, color_name) for time in start_times]
+            self.__insert_events(active_calendar, bodies)
+
+    def __has_conflicts(self, bodies: list) -> bool:
+        """Checks new events against events of all calendars over the same time span, prints conflicts"""
+        from gcaltools.conflicts import AttendeeIntervalIndex
+        from gcaltools.events import Event
+        from pytz import timezone
+
+        new_events = [Event.from_api(body, timezone(self.calendar_manager.default_timezone)) for body in bodies]
+        # Bodies are in the default time zone, like stored events queries
+        time_min = min(e.start for e in new_events).replace(tzinfo=None)
+        time_max = max(e.end for e in new_events).replace(tzinfo=None)
+        calendar_names = [cal['summary'] for cal in self.calendar_manager.get_calendars()]
+        self.calendar_manager.sync_calendars(calendar_names)
+
+        index = AttendeeIntervalIndex()
+        for calendar_name in calendar_names:
+            index.add_events(calendar_name, self.__stored_events(calendar_name, time_min, time_max))
+
+        conflicts_found = False
+        for event in new_events:
+            for email, calendar_name, other in index.event_conflicts(event):
+                conflicts_found = True
+                print('WARNING: {} is already booked in {} ({}, {})'.format(email, other.summary, calendar_name, other.start.isoformat()))
+        return conflicts_found
+
+    def __insert_events(self, calendar_name: str, bodies: list):
+        job = current_job()
+        if job is not None:
+            job.total = len(bodies)
+        errors = self.calendar_manager.insert_events(calendar_name, bodies, progress=job.advance if job is not None else None)
+        for body, error in zip(bodies, errors):
+            if error is None:
+                print('Event created: {} ({})'.format(body['summary'], body['start']['dateTime']))
+            else:
+                print('ERROR: unable to create event {} ({}): {}'.format(body['summary'], body['start']['dateTime'], error))
+        return errors
+
+    # gcaltools IMPORT command
+    def __command_import(self, command_args):
+        from gcaltools.planner import expand_plan, load_plan
+        from gcaltools.printer import import_progress
+
+        try:
+            entries = load_plan(command_args.plan)
+        except OSError:
+            print("ERROR: Unable to read plan file {}".format(command_args.plan))
+            exit()
+        except (yaml.YAMLError, csv.Error):
+            print("ERROR: Unable to parse plan file {}".format(command_args.plan))
+            exit()
+
+        templates = self.__load_templates() if any(isinstance(e, dict) and 'template' in e for e in entries) else {}
+        events, errors = expand_plan(entries, templates, self.calendar_manager)
+
+        if errors:
+            for error in errors:
+                print('ERROR: {}'.format(error))
+            print('ERROR: plan {} is not valid, no event created.'.format(command_args.plan))
+            exit()
+
+        for calendar_name in sorted(events):
+            print('{}: {} events'.format(calendar_name, len(events[calendar_name])))
+
+        if command_args.dry_run:
+            return
+
+        job = current_job()
+        if job is not None:
+            # Background job: progress is displayed by the jobs command
+            job.total = sum(len(e) for e in events.values())
+
+        failures = 0
+        with import_progress() if job is None else nullcontext() as progress:
+            for calendar_name in sorted(events):
+                if job is None:
+                    task = progress.add_task(calendar_name, total=len(events[calendar_name]))
+                    advance = lambda count, task=task: progress.advance(task, count)
+                else:
+                    advance = job.advance
+                errors = self.calendar_manager.insert_events(calendar_name, events[calendar_name], progress=advance)
+                for body, error in zip(events[calendar_name], errors):
+                    if error is not None:
+                        failures += 1
+                        print('ERROR: unable to create event {} ({}): {}'.format(body['summary'], body['start']['dateTime'], error))
+
+        print('Import complete: {} events created, {} failed.'.format(sum(len(e) for e in events.values()) - failures, failures))
+
+    # gcaltools CACHE command
+    def __command_cache(self, command_args):
+        from gcaltools.http_cache import ResponseCache
+        from gcaltools.printer import cache_stats_printer
+        response_cache = ResponseCache()
+
+        if command_args.subcommand == 'stats':
+            cache_stats_printer(response_cache.stats())
+
+        if command_args.subcommand == 'clear':
+            response_cache.clear()
+            if command_args.events:
+                self.calendar_manager.event_store.clear()
+            cache_stats_printer(response_cache.stats())
 
     # gcaltools LIST command
     def __command_list(self):
+        from gcaltools.printer import calendar_list_printer
         calendar_list_printer(self.calendar_manager.get_calendars())
 
     # gcaltools SHOW command
     def __command_show(self, command_args):
+        from gcaltools.printer import events_printer
         min_time = command_args.startDate
 
         # Display only one day if no end date is given
@@ -123,13 +351,11 @@ class CliCommand:
 
         # Displays events for the current week
         if command_args.w:
-            min_time = (datetime.now() - timedelta(days=(datetime.now().weekday()))).replace(hour=0, minute=0, second=0)
-            max_time = min_time + timedelta(days=6)
+            min_time, max_time = current_week()
 
         # Displays events for the current month
         if command_args.m:
-            min_time = datetime.now().replace(day=1, hour=0, minute=0, second=0)
-            max_time = min_time.replace(day=monthrange(min_time.year, min_time.month)[1], hour=23, minute=59, second=59)
+            min_time, max_time = current_month()
 
         if command_args.calendar:
             if not self.calendar_manager.calendar_exists(command_args.calendar):
@@ -142,10 +368,11 @@ class CliCommand:
                 print('ERROR: default calendar not set')
                 exit()
 
-        events_printer(self.calendar_manager.get_events(active_calendar, time_min=min_time, time_max=max_time, max_results=1000))
+        events_printer(self.__get_events(active_calendar, min_time, max_time, command_args))
 
     # gcaltools DEFAULT command
     def __command_default(self, command_args):
+        from gcaltools.printer import default_printer
         if command_args.calendar:
             if self.calendar_manager.calendar_exists(command_args.calendar):
                 self.calendar_manager.default_calendar = command_args.calendar
@@ -161,23 +388,46 @@ class CliCommand:
         if command_args.attendees_catalog:
             self.calendar_manager.attendees_catalog = command_args.attendees_catalog
 
+        if command_args.http_pool_size:
+            self.calendar_manager.http_pool_size = command_args.http_pool_size
+
+        if command_args.http_timeout:
+            self.calendar_manager.http_timeout = command_args.http_timeout
+
+        if command_args.http_gzip:
+            self.calendar_manager.http_gzip = command_args.http_gzip == 'on'
+
         if command_args.reset:
             self.calendar_manager.reset_user_preferences()
 
         default_printer(self.calendar_manager.get_user_preferences())
 
+    def __active_calendars(self, command_args) -> list:
+        if command_args.all:
+            return [cal['summary'] for cal in self.calendar_manager.get_calendars()]
+        if command_args.calendar:
+            for calendar_name in command_args.calendar:
+                if not self.calendar_manager.calendar_exists(calendar_name):
+                    print('ERROR: calendar {} does not exist.'.format(calendar_name))
+                    exit()
+            return list(dict.fromkeys(command_args.calendar))
+        if self.calendar_manager.default_calendar is None:
+            print('ERROR: default calendar not set')
+            exit()
+        return [self.calendar_manager.default_calendar]
+
+    def __sync_calendars(self, calendar_names: list, command_args) -> None:
+        """Fetches changes of all calendars concurrently, events are then read from the local store"""
+        if not command_args.offline:
+            self.calendar_manager.sync_calendars(calendar_names, full=command_args.refresh, max_workers=command_args.workers)
+
+    def __stored_events(self, calendar_name: str, time_min, time_max):
+        return self.calendar_manager.iter_stored_events(calendar_name, time_min=time_min, time_max=time_max, offline=True)
+
     # gcaltools REPORT command
     def __command_report(self, command_args):
-        if command_args.calendar:
-            if not self.calendar_manager.calendar_exists(command_args.calendar):
-                print('ERROR: calendar {} does not exist.'.format(command_args.calendar))
-                exit()
-            active_calendar = command_args.calendar
-        else:
-            active_calendar = self.calendar_manager.default_calendar
-            if active_calendar is None:
-                print('ERROR: default calendar not set')
-                exit()
+        from gcaltools.reporter import generate_report
+        active_calendars = self.__active_calendars(command_args)
 
         if command_args.start_date and command_args.end_date:
             min_time = command_args.start_date
@@ -193,31 +443,129 @@ class CliCommand:
 
         attendees_catalog = command_args.attendees_catalog if command_args.attendees_catalog is not None else self.calendar_manager.attendees_catalog
 
-        default_filename = "{}_{}_{}".format(active_calendar, min_time.strftime("%Y%m%d"), max_time.strftime("%Y%m%d"))
-        print(default_filename)
+        self.__sync_calendars(active_calendars, command_args)
+
+        if len(active_calendars) == 1 or command_args.split:
+            for active_calendar in active_calendars:
+                default_filename = "{}_{}_{}".format(active_calendar, min_time.strftime("%Y%m%d"), max_time.strftime("%Y%m%d"))
+                if command_args.filename is None:
+                    report_filename = default_filename
+                elif len(active_calendars) > 1:
+                    report_filename = "{}_{}".format(command_args.filename, active_calendar)
+                else:
+                    report_filename = command_args.filename
+                calendars_events = {active_calendar: self.__stored_events(active_calendar, min_time, max_time)}
+                generate_report(command_args.outputformat, calendars_events, report_filename, active_year, active_month, min_time, max_time, attendees_catalog, self.calendar_manager.default_timezone, command_args.append)
+        else:
+            default_filename = "calendars_{}_{}".format(min_time.strftime("%Y%m%d"), max_time.strftime("%Y%m%d"))
+            report_filename = command_args.filename if command_args.filename is not None else default_filename
+            calendars_events = {c: self.__stored_events(c, min_time, max_time) for c in active_calendars}
+            generate_report(command_args.outputformat, calendars_events, report_filename, active_year, active_month, min_time, max_time, attendees_catalog, self.calendar_manager.default_timezone, command_args.append)
 
-        report_filename = command_args.filename if command_args.filename is not None else default_filename
+    # gcaltools CONFLICTS command
+    def __command_conflicts(self, command_args):
+        from gcaltools.conflicts import AttendeeIntervalIndex
+        from gcaltools.printer import conflicts_printer
+        active_calendars = self.__active_calendars(command_args)
 
-        if command_args.outputformat == "md":
-            # TO DO
-            pass
+        min_time = command_args.start_date if command_args.start_date is not None else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = command_args.end_date if command_args.end_date is not None else min_time + timedelta(days=30)
+        max_time = end_date.replace(hour=23, minute=59, second=59)
+
+        self.__sync_calendars(active_calendars, command_args)
+
+        index = AttendeeIntervalIndex()
+        for active_calendar in active_calendars:
+            index.add_events(active_calendar, self.__stored_events(active_calendar, min_time, max_time))
 
+        conflicts_printer(index.conflicts(), min_time, max_time)
+
+    # gcaltools FIND-SLOT command
+    def __command_find_slot(self, command_args):
+        from gcaltools.gcal_api import FreeBusyError
+        from gcaltools.printer import slots_printer
+        from gcaltools.slots import candidate_slots, free_slots
+
+        if command_args.template:
+            attendees = self.__load_template(command_args.template)['attendees']
+            if not attendees:
+                print('ERROR: Template {} has no attendees'.format(command_args.template))
+                exit()
         else:
-            file_extension = ".xlsx"
-            xlsx_report(self.calendar_manager.get_events(active_calendar, time_min=min_time, time_max=max_time, max_results=1000), report_filename + file_extension, active_year, active_month, min_time, max_time, attendees_catalog)
+            attendees = command_args.attendees
+        attendees = list(dict.fromkeys(attendees))
+
+        first_day = command_args.start_date if command_args.start_date is not None else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = command_args.end_date if command_args.end_date is not None else first_day + timedelta(days=30)
+        duration = command_args.duration if command_args.duration else self.calendar_manager.default_event_duration
+        start_times = command_args.start if command_args.start else [datetime.strptime(PERIODS[p], "%H:%M") for p in PERIODS]
+        weekdays = range(7) if command_args.weekends else range(5)
+
+        candidates = list(candidate_slots(first_day, last_day, start_times, duration, self.calendar_manager.default_timezone, weekdays))
+        if not candidates:
+            slots_printer([], attendees)
+            return
+
+        # Only busy intervals are downloaded, over the span of candidate slots
+        time_min = candidates[0][0].replace(tzinfo=None)
+        time_max = max(end for _, end in candidates).replace(tzinfo=None)
+        try:
+            busy = self.calendar_manager.free_busy(attendees, time_min, time_max)
+        except FreeBusyError as e:
+            for failure in e.failures:
+                print('ERROR: unable to get free/busy information: {}'.format(failure))
+            exit()
+
+        slots_printer(free_slots(busy, candidates, command_args.count), attendees)
+
+    # gcaltools SEARCH command
+    def __command_search(self, command_args):
+        from gcaltools.event_store import search_query
+        from gcaltools.printer import events_printer
+        from gcaltools.reporter import load_attendees
+        active_calendars = self.__active_calendars(command_args)
+        attendees_dict = load_attendees(self.calendar_manager.attendees_catalog) if self.calendar_manager.attendees_catalog is not None else {}
+
+        # Attendees are given by email or by (part of) their display name in the catalog
+        attendees = []
+        for attendee in command_args.attendee or []:
+            if '@' in attendee:
+                emails = [attendee.lower()]
+            else:
+                emails = [email.lower() for email, name in attendees_dict.items() if attendee.lower() in str(name).lower()]
+                if not emails:
+                    print('ERROR: attendee {} not found in attendees catalog.'.format(attendee))
+                    exit()
+            attendees.append(emails)
+
+        terms = [search_query(' '.join(command_args.query), attendees_dict)]
+        terms += ['({})'.format(' OR '.join('attendees : "{}"'.format(email) for email in emails)) for emails in attendees]
+        query = ' AND '.join(term for term in terms if term)
+        if not query:
+            print('ERROR: No search terms or attendee given.')
+            exit()
+
+        min_time = command_args.start_date
+        max_time = command_args.end_date.replace(hour=23, minute=59, second=59) if command_args.end_date is not None else None
+
+        self.__sync_calendars(active_calendars, command_args)
+
+        events = []
+        for calendar_name, event in self.calendar_manager.search_stored_events(active_calendars, query, min_time, max_time):
+            # Index matches attendee email words, exact emails are checked here
+            event_attendees = {email.lower() for email in event.attendee_emails}
+            if all(event_attendees.intersection(emails) for emails in attendees):
+                events.append(event)
+                if len(events) >= command_args.limit:
+                    break
+
+        events_printer(events)
 
     # gcaltools SUMMARY command
     def __command_summary(self, command_args):
-        if command_args.calendar:
-            if not self.calendar_manager.calendar_exists(command_args.calendar):
-                print('ERROR: calendar {} does not exist.'.format(command_args.calendar))
-                exit()
-            active_calendar = command_args.calendar
-        else:
-            active_calendar = self.calendar_manager.default_calendar
-            if active_calendar is None:
-                print('ERROR: default calendar not set')
-                exit()
+        from gcaltools.printer import summary_printer
+        from gcaltools.summary import Summary
+        active_calendars = self.__active_calendars(command_args)
 
         if command_args.start_date and command_args.end_date:
             start = command_args.start_date
@@ -226,32 +574,36 @@ class CliCommand:
             start = None
             end = None
 
-        calendar_summary = {}
-
-        events = self.calendar_manager.get_events(active_calendar, time_min=start, time_max=end, max_results=1000)
+        self.__sync_calendars(active_calendars, command_args)
 
-        calendar_summary['Training days with trainer'] = len([e for e in events if 'attendees' in e.keys()])/2
-        calendar_summary['Training days without trainer'] = len([e for e in events if 'attendees' not in e.keys() and ('colorId' not in e.keys() or ('colorId' in e.keys() and int(e['colorId'])) != COLORS['graphite'])])/2
-        calendar_summary['Total training days'] = len([e for e in events if 'colorId' not in e.keys() or int(e['colorId']) != COLORS['graphite']])/2
+        metrics = list(dict.fromkeys(command_args.metric)) if command_args.metric else ['days']
+        total = Summary(metrics, self.calendar_manager.default_timezone, command_args.bucket)
+        for active_calendar in active_calendars:
+            calendar_summary = Summary(metrics, self.calendar_manager.default_timezone, command_args.bucket, active_calendar).add_events(self.__stored_events(active_calendar, start, end))
+            for bucket, results in calendar_summary.results().items():
+                summary_printer(active_calendar, results, start, end, bucket)
+            if command_args.total:
+                total.merge(calendar_summary)
 
-        summary_printer(active_calendar, calendar_summary, start, end)
+        if command_args.total:
+            for bucket, results in total.results().items():
+                summary_printer('All calendars', results, start, end, bucket)
 
     # gcaltools TEMPLATE command
     def __command_template(self, command_args):
+        from gcaltools.printer import templates_printer
 
-        if not os.path.exists(self._template_file):
+        if not self._templates.exists():
             try:
-                with open(self._template_file, 'w') as f:
-                    templates = {}
-                    yaml.dump(templates, f, Dumper=yaml.Dumper)
+                templates = {}
+                self._templates.save(templates)
             except OSError:
                 print("ERROR: Unable to create template file {}".format(self._template_file))
                 exit()
 
         else:
             try:
-                with open(self._template_file) as f:
-                    templates = yaml.load(f, Loader=yaml.Loader)
+                templates = self._templates.load({})
             except OSError:
                 print("ERROR: Unable to create template file {}".format(self._template_file))
                 exit()
@@ -279,8 +631,7 @@ class CliCommand:
                 templates[command_args.name] = template
 
                 try:
-                    with open(self._template_file, 'w') as f:
-                        yaml.dump(templates, f, Dumper=yaml.Dumper)
+                    self._templates.save(templates)
                     templates_printer(templates)
                 except OSError:
                     print("ERROR: Unable to save templates to file {}".format(self._template_file))
@@ -295,8 +646,7 @@ class CliCommand:
             else:
                 del(templates[command_args.name])
                 try:
-                    with open(self._template_file, 'w') as f:
-                        yaml.dump(templates, f, Dumper=yaml.Dumper)
+                    self._templates.save(templates)
                     templates_printer(templates)
                 except OSError:
                     print("ERROR: Unable to save templates to file {}".format(self._template_file))
@@ -2,7 +2,7 @@ import argparse
 import re
 from datetime import datetime
 from gcaltools.utils import today_date
-from gcaltools.config import __VERSION, COLORS, PERIODS
+from gcaltools.config import __VERSION, COLORS, PERIODS, MAX_WORKERS, DAEMON_SOCKET_PATH, SUMMARY_BUCKETS, SUMMARY_METRICS
 
 email_pattern = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
 
@@ -37,6 +37,19 @@ def valid_attendees(attendees_string):
         raise argparse.ArgumentTypeError(msg)
 
 
+def add_sync_arguments(parser):
+    sync_group = parser.add_mutually_exclusive_group()
+    sync_group.add_argument('--refresh', action='store_true', help="Drop local events copy and download all events again")
+    sync_group.add_argument('--offline', action='store_true', help="Use local events copy without contacting Google Calendar")
+
+
+def add_calendars_arguments(parser):
+    calendars_group = parser.add_mutually_exclusive_group()
+    calendars_group.add_argument('-c', '--calendar', type=str, action='append', help="Calendar name (repeat for several calendars)")
+    calendars_group.add_argument('--all', action='store_true', help="All available calendars")
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS, help="Calendars fetched concurrently (default: {})".format(MAX_WORKERS))
+
+
 def cli_parser():
     parser = argparse.ArgumentParser()
     sub_parser = parser.add_subparsers(dest='command')
@@ -48,8 +61,20 @@ def cli_parser():
     sub_parser_default(sub_parser)
     sub_parser_summary(sub_parser)
     sub_parser_template(sub_parser)
+    sub_parser_cache(sub_parser)
+    sub_parser_import(sub_parser)
+    sub_parser_conflicts(sub_parser)
+    sub_parser_find_slot(sub_parser)
+    sub_parser_search(sub_parser)
+    sub_parser_daemon(sub_parser)
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __VERSION)
     parser.add_argument('-i', '--interactive', action ='store_true')
+    parser.add_argument('--debug-bytes', action='store_true', help="Display size of API responses after each command")
+    parser.add_argument('--profile', action='store_true', help="Display time spent per phase and API method after the command")
+    parser.add_argument('--profile-json', metavar='FILE', help="Write profile of the command to FILE (JSON)")
+    parser.add_argument('--profile-memory', action='store_true', help="Also trace peak memory in profiles (slow)")
+    parser.add_argument('--use-daemon', action='store_true', help="Run command in the gcaltools daemon (also set by GCALTOOLS_USE_DAEMON=1)")
+    parser.add_argument('--socket', default=DAEMON_SOCKET_PATH, help="Unix socket of the gcaltools daemon (default: {}, set by GCALTOOLS_DAEMON_SOCKET)".format(DAEMON_SOCKET_PATH))
     return parser
 
 
@@ -57,23 +82,36 @@ def sub_parser_auth(sub_parser, add_help=True):
     sub_parser.add_parser('remoteauth', help="Google API Auth without local webserver.", add_help=add_help)
 
 
+def sub_parser_daemon(sub_parser, add_help=True):
+    daemon_parser = sub_parser.add_parser('daemon', help="Serve gcaltools commands from a resident process, see --use-daemon", add_help=add_help)
+    # Same option as the global one, accepted after the subcommand too
+    daemon_parser.add_argument('--socket', default=argparse.SUPPRESS, help="Unix socket path (default: {}, set by GCALTOOLS_DAEMON_SOCKET)".format(DAEMON_SOCKET_PATH))
+
+
 def sub_parser_summary(sub_parser, add_help=True):
     summary_parser = sub_parser.add_parser('summary', help="Display events summary for given calendar.", add_help=add_help)
-    summary_parser.add_argument('-c', '--calendar', type=str, help="Calendar name")
+    add_calendars_arguments(summary_parser)
     summary_parser.add_argument('-s', '--start_date', type=valid_date, help="Summary first day, format: YYYY-MM-DD")
     summary_parser.add_argument('-e', '--end_date', type=valid_date, help="Summary last day, format: YYYY-MM-DD")
+    summary_parser.add_argument('-M', '--metric', choices=SUMMARY_METRICS, action='append', help="Summary figures: training days, hours per attendee, events per color, days per title (repeat for several, default: days)")
+    summary_parser.add_argument('-b', '--bucket', choices=SUMMARY_BUCKETS, help="One summary per week or per month")
+    summary_parser.add_argument('--total', action='store_true', help="Also display the summary of all calendars together")
+    add_sync_arguments(summary_parser)
 
 
 def sub_parser_report(sub_parser, add_help=True):
     report_parser = sub_parser.add_parser('report', help="Generates month occupation reports based on event attendees", add_help=add_help)
-    report_parser.add_argument('-c', '--calendar', type=str, help="Calendar name")
+    add_calendars_arguments(report_parser)
+    report_parser.add_argument('--split', action='store_true', help="One file per calendar instead of one worksheet per calendar")
     report_parser.add_argument('-m', '--month', type=int, help="Month")
     report_parser.add_argument('-y', '--year', type=int, help="Year")
-    report_parser.add_argument('-o', '--outputformat', type=int, help="Report output format (not yet implemented)")
+    report_parser.add_argument('-o', '--outputformat', choices=['xlsx', 'csv', 'md', 'parquet'], default='xlsx', help="Report output format, default: xlsx")
+    report_parser.add_argument('--append', action='store_true', help="Append to an existing csv report, or add a file to a parquet dataset directory")
     report_parser.add_argument('-f', '--filename', type=str, help="Name for the output file")
     report_parser.add_argument('-a', '--attendees_catalog', type=str, help="Catalog of attendees mapping email with names for report generation")
     report_parser.add_argument('-s', '--start_date', type=valid_date, help="Summary first day, format: YYYY-MM-DD")
     report_parser.add_argument('-e', '--end_date', type=valid_date, help="Summary last day, format: YYYY-MM-DD")
+    add_sync_arguments(report_parser)
 
 
 def sub_parser_add(sub_parser, add_help=True):
@@ -88,6 +126,7 @@ def sub_parser_add(sub_parser, add_help=True):
     add_parser.add_argument('-d', '--duration', type=int, help="Event duration (minutes)")
     add_parser.add_argument('-a', '--attendees', type=valid_attendees, help="List of emails of attendees", required=False)
     add_parser.add_argument('-o', '--override-color', type=str, choices=[c for c in sorted(COLORS.keys())], help="List of emails of attendees", default="")
+    add_parser.add_argument('-k', '--check-conflicts', action='store_true', help="Do not create events if an attendee is already booked in any calendar")
 
 
 def sub_parser_list(sub_parser, add_help=True):
@@ -102,6 +141,7 @@ def sub_parser_show(sub_parser, add_help=True):
     show_parser.add_argument('-c', '--calendar', type=str, help="Calendar name")
     show_parser.add_argument('startDate', type=valid_date, help="First date to search for events", default=today_date(), nargs="?")
     show_parser.add_argument('endDate', type=valid_date, help="Last date to search for events", nargs="?")
+    add_sync_arguments(show_parser)
 
 
 def sub_parser_default(sub_parser, add_help=True):
@@ -112,6 +152,9 @@ def sub_parser_default(sub_parser, add_help=True):
     setting_group.add_argument('-r', '--reset', help="Erase .gcaltools file (resets all user preferences)", action="store_true")
     setting_group.add_argument('-t', '--timezone', type=str, help="Set default time zone (IANA format ie: \"Europe/Brussels\")")
     setting_group.add_argument('-a', '--attendees_catalog', type=str, help="Catalog of attendees mapping email with names for report generation")
+    setting_group.add_argument('--http-pool-size', type=int, help="Set number of concurrent HTTP connections to Google Calendar")
+    setting_group.add_argument('--http-timeout', type=int, help="Set HTTP requests timeout (seconds)")
+    setting_group.add_argument('--http-gzip', type=str, choices=['on', 'off'], help="Enable or disable gzip compressed responses")
 
 
 def sub_parser_template(sub_parser, add_help=True):
@@ -130,3 +173,47 @@ def sub_parser_template(sub_parser, add_help=True):
     tpl_del.add_argument('name', help="Template name")
 
 
+def sub_parser_cache(sub_parser, add_help=True):
+    cache_parser = sub_parser.add_parser('cache', help="Manage local caches", add_help=add_help)
+    cache_actions = cache_parser.add_subparsers(dest="subcommand")
+    cache_actions.add_parser('stats', help="Display HTTP response cache usage", add_help=add_help)
+    cache_clear = cache_actions.add_parser('clear', help="Empty HTTP response cache", add_help=add_help)
+    cache_clear.add_argument('--events', action='store_true', help="Also drop local events copy")
+
+
+def sub_parser_import(sub_parser, add_help=True):
+    import_parser = sub_parser.add_parser('import', help="Create events from a course schedule plan (YAML or CSV)", add_help=add_help)
+    import_parser.add_argument('plan', type=str, help="Plan file: template, calendar, start_date, end_date, weekdays, period, duration, color, attendees")
+    import_parser.add_argument('-n', '--dry-run', action='store_true', help="Validate plan and display events count without creating events")
+
+
+def sub_parser_conflicts(sub_parser, add_help=True):
+    conflicts_parser = sub_parser.add_parser('conflicts', help="Lists attendees booked in overlapping events", add_help=add_help)
+    add_calendars_arguments(conflicts_parser)
+    conflicts_parser.add_argument('-s', '--start_date', type=valid_date, help="First day, format: YYYY-MM-DD (default: today)")
+    conflicts_parser.add_argument('-e', '--end_date', type=valid_date, help="Last day, format: YYYY-MM-DD (default: 30 days after first day)")
+    add_sync_arguments(conflicts_parser)
+
+
+def sub_parser_find_slot(sub_parser, add_help=True):
+    slot_parser = sub_parser.add_parser('find-slot', help="Finds first slots when all attendees are free", add_help=add_help)
+    attendees_group = slot_parser.add_mutually_exclusive_group(required=True)
+    attendees_group.add_argument('-a', '--attendees', type=valid_attendees, help="List of emails of attendees")
+    attendees_group.add_argument('-T', '--template', type=str, help="Use attendees of event template from templates.yaml")
+    slot_parser.add_argument('-s', '--start_date', type=valid_date, help="First day, format: YYYY-MM-DD (default: today)")
+    slot_parser.add_argument('-e', '--end_date', type=valid_date, help="Last day, format: YYYY-MM-DD (default: 30 days after first day)")
+    slot_parser.add_argument('-t', '--start', type=valid_time, action='append', help="Slot start time, format: HH:MM OR am OR pm (repeat for several, default: am and pm)")
+    slot_parser.add_argument('-d', '--duration', type=int, help="Slot duration (minutes)")
+    slot_parser.add_argument('-n', '--count', type=int, default=5, help="Number of slots to display (default: 5)")
+    slot_parser.add_argument('--weekends', action='store_true', help="Also search on saturdays and sundays")
+
+
+def sub_parser_search(sub_parser, add_help=True):
+    search_parser = sub_parser.add_parser('search', help="Searches events in local events copy", add_help=add_help)
+    search_parser.add_argument('query', type=str, nargs='*', help="Words to find in title, description, attendees or color (\"exact phrase\", prefix*)")
+    add_calendars_arguments(search_parser)
+    search_parser.add_argument('-a', '--attendee', type=str, action='append', help="Attendee email or display name from attendees catalog (repeat for several)")
+    search_parser.add_argument('-s', '--start_date', type=valid_date, help="First day, format: YYYY-MM-DD")
+    search_parser.add_argument('-e', '--end_date', type=valid_date, help="Last day, format: YYYY-MM-DD")
+    search_parser.add_argument('-n', '--limit', type=int, default=50, help="Maximum number of events displayed (default: 50)")
+    add_sync_arguments(search_parser)
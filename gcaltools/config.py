@@ -1,3 +1,5 @@
+import os
+
 # General variables
 __VERSION = "1.0.1"
 
@@ -6,9 +8,82 @@ PERIODS = {
     "pm": "13:30"
 }
 
+# Summary metrics and buckets (see summary.py), listed here so that the parser does not import summary
+SUMMARY_METRICS = ['days', 'attendees', 'colors', 'titles']
+SUMMARY_BUCKETS = ['week', 'month']
+
 # NEVER CHANGE THIS
 SCOPES = ['https://www.googleapis.com/auth/calendar.events', 'https://www.googleapis.com/auth/calendar', 'https://www.googleapis.com/auth/calendar.addons.execute']
 DATE_FORMAT = "%Y-%m-%d"
+
+# Events returned per events.list page (API maximum is 2500)
+EVENTS_PAGE_SIZE = 250
+# Requests grouped in one batch request (API maximum is 50)
+BATCH_MAX_SIZE = 50
+# Attempts for batch sub-requests failing with a transient error
+BATCH_MAX_ATTEMPTS = 4
+
+# Calendars per freeBusy query (API maximum is 50), days covered by one query
+FREEBUSY_MAX_ITEMS = 50
+FREEBUSY_MAX_DAYS = 60
+
+# Calendars fetched concurrently by multi-calendar commands
+MAX_WORKERS = 8
+
+# Authorized keep-alive HTTP transports shared by worker threads, request timeout (seconds)
+HTTP_POOL_SIZE = MAX_WORKERS
+HTTP_TIMEOUT = 60
+
+# Socket of the resident gcaltools process (see daemon.py), only reachable by its owner
+DAEMON_SOCKET_PATH = os.environ.get('GCALTOOLS_DAEMON_SOCKET', os.path.join(os.path.expanduser('~'), '.gcaltools/daemon.sock'))
+# The daemon fetches the calendar list again (revalidated with its ETag) when older than this (seconds)
+DAEMON_CALENDARS_MAX_AGE = 300
+
+# Request scheduler, see scheduler.py
+# Requests per second (batch sub-requests included), starting at the Calendar API default per user quota
+# (600 per minute) and adapted between API_MIN_RATE and API_MAX_RATE: halved when throttled, raised by
+# API_RATE_STEP after each successful request. Up to API_BURST requests are sent at once (one full batch).
+API_RATE = 10
+API_MIN_RATE = 1
+API_MAX_RATE = 50
+API_RATE_STEP = 0.1
+API_BURST = BATCH_MAX_SIZE
+# Throttling signals within this many seconds of a slow down are part of the same slow down
+API_THROTTLE_WINDOW = 1
+# Attempts of requests failing with a transient error, retry delays are random up to
+# API_RETRY_DELAY * 2 ** retry seconds, at most API_MAX_RETRY_DELAY
+API_MAX_ATTEMPTS = 5
+API_RETRY_DELAY = 1
+API_MAX_RETRY_DELAY = 32
+
+# Partial responses: only fields read by gcaltools are requested (fields= parameter)
+CALENDAR_LIST_FIELDS = 'nextPageToken,items(id,summary,timeZone)'
+EVENT_FIELDS = 'id,iCalUID,status,summary,description,colorId,start,end,attendees(email,displayName,responseStatus)'
+EVENTS_LIST_FIELDS = 'nextPageToken,items({})'.format(EVENT_FIELDS)
+EVENTS_SYNC_FIELDS = 'nextPageToken,nextSyncToken,items({})'.format(EVENT_FIELDS)
+EVENT_INSERT_FIELDS = 'id'
+FREEBUSY_FIELDS = 'calendars'
+
+# Worksheets per xlsx report file: in constant memory mode every worksheet keeps a temporary file
+# open until the workbook is closed, larger reports continue in other files (ie: report-2.xlsx)
+XLSX_MAX_SHEETS = 250
+
+# Maximum size of the on-disk HTTP response cache (bytes)
+HTTP_CACHE_MAX_SIZE = 50 * 1024 * 1024
+# Decoded bodies of cached responses kept in memory for 304 revalidations (least recently used are dropped)
+DECODED_CACHE_MAX_ENTRIES = 32
+
+# Events returned per page when syncing the local event store
+EVENTS_SYNC_PAGE_SIZE = 2500
+
+# Interactive mode: current week and month of the default calendar are prefetched while the user types,
+# again when older than PREFETCH_INTERVAL, and served by show -w / -m up to PREFETCH_MAX_AGE (seconds)
+PREFETCH_INTERVAL = 60
+PREFETCH_MAX_AGE = 300
+
+# Interactive mode: commands always run as background jobs (any command ending with & does too)
+BACKGROUND_COMMANDS = ['import', 'report']
+
 # DATETIME_FORMAT = "%Y-%m-%d %H:%M"
 # GCAL_DATE_FORMAT = "%Y-%m-%dT00:00:00+00:00"
 # USER_PREFERENCES_FILE = '.gcaltools'
@@ -26,4 +101,4 @@ COLORS = {
     'tomato': 11,
 }
 
-AVAILABLE_COMMANDS = ['add', 'default', 'help', 'list', 'report', 'summary', 'template', 'quit']
\ No newline at end of file
+AVAILABLE_COMMANDS = ['add', 'cache', 'cancel', 'conflicts', 'default', 'find-slot', 'help', 'import', 'jobs', 'list', 'report', 'search', 'summary', 'template', 'quit']
\ No newline at end of file
@@ -0,0 +1,102 @@
+import heapq
+from bisect import bisect_left
+
+from gcaltools.events import ATTENDEES
+
+
+def event_interval(event):
+    """Returns (start, end) POSIX timestamps of a timed event, None for all day events"""
+    if event.all_day:
+        return None
+    return event.start.timestamp(), event.end.timestamp()
+
+
+def event_key(event) -> tuple:
+    """Identity of an event across calendars
+    Instances of a recurring event share their iCalUID, their start tells them apart.
+    """
+    return event.uid, event.start
+
+
+def same_event(event, other) -> bool:
+    """Return True for copies of one event, ie: an invitation shown in several calendars"""
+    return event_key(event) == event_key(other)
+
+
+class AttendeeIntervalIndex:
+    """Booked time intervals of each attendee
+    Intervals are kept sorted by start per attendee, with the running maximum of their ends,
+    so overlaps with a new interval are found by bisection instead of scanning every event.
+    """
+
+    def __init__(self) -> None:
+        self._intervals = {}
+        self._starts = {}
+        self._max_ends = {}
+        self._indexed = set()
+
+    def add_event(self, calendar_name: str, event) -> None:
+        """Registers event for each of its attendees, all day events are ignored"""
+        interval = event_interval(event)
+        if interval is None:
+            return
+        key = event_key(event)
+        for attendee in event.booked_attendees:
+            # Copies of an event found in several calendars are indexed once
+            if (attendee, key) in self._indexed:
+                continue
+            self._indexed.add((attendee, key))
+            self._intervals.setdefault(attendee, []).append((interval[0], interval[1], calendar_name, event))
+            # Sorted views are rebuilt on next lookup
+            self._starts.pop(attendee, None)
+
+    def add_events(self, calendar_name: str, event_list) -> None:
+        for event in event_list:
+            self.add_event(calendar_name, event)
+
+    def __sorted(self, attendee: int):
+        if attendee not in self._starts:
+            intervals = self._intervals.get(attendee, [])
+            intervals.sort(key=lambda i: (i[0], i[1]))
+            self._starts[attendee] = [i[0] for i in intervals]
+            max_ends = []
+            max_end = float('-inf')
+            for interval in intervals:
+                max_end = max(max_end, interval[1])
+                max_ends.append(max_end)
+            self._max_ends[attendee] = max_ends
+        return self._intervals.get(attendee, []), self._starts[attendee], self._max_ends[attendee]
+
+    def overlapping(self, attendee: int, event):
+        """Yield (calendar_name, event) of attendee overlapping given timed event"""
+        start, end = event_interval(event)
+        intervals, starts, max_ends = self.__sorted(attendee)
+        # Candidates start before end, walk back while some earlier interval may still end after start
+        index = bisect_left(starts, end) - 1
+        while index >= 0 and max_ends[index] > start:
+            if intervals[index][1] > start and not same_event(event, intervals[index][3]):
+                yield intervals[index][2], intervals[index][3]
+            index -= 1
+
+    def event_conflicts(self, event) -> list:
+        """Returns (email, calendar_name, event) of indexed events double-booking attendees of a new event"""
+        interval = event_interval(event)
+        if interval is None:
+            return []
+        return [(ATTENDEES.email(attendee), calendar_name, other) for attendee in event.booked_attendees for calendar_name, other in self.overlapping(attendee, event)]
+
+    def conflicts(self):
+        """Yield (email, (calendar_name, event), (calendar_name, event)) for every overlapping pair
+        Sweep line over intervals sorted by start, the heap holds intervals still running.
+        """
+        for attendee in sorted(self._intervals, key=ATTENDEES.email):
+            intervals = self.__sorted(attendee)[0]
+            email = ATTENDEES.email(attendee)
+            running = []
+            for number, (start, end, calendar_name, event) in enumerate(intervals):
+                while running and running[0][0] <= start:
+                    heapq.heappop(running)
+                for _, _, other_calendar, other in running:
+                    if not same_event(event, other):
+                        yield email, (other_calendar, other), (calendar_name, event)
+                heapq.heappush(running, (end, number, calendar_name, event))
@@ -0,0 +1,186 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+import traceback
+
+from gcaltools.config import DAEMON_CALENDARS_MAX_AGE, DAEMON_SOCKET_PATH
+
+# Commands needing the user terminal are always run by the client process
+LOCAL_COMMANDS = ('daemon', 'remoteauth')
+
+
+class SocketWriter:
+    """File-like object sending written text to the client as output messages"""
+
+    def __init__(self, wfile) -> None:
+        self._wfile = wfile
+
+    def write(self, text: str) -> int:
+        if text:
+            send_message(self._wfile, {'out': text})
+        return len(text)
+
+    def flush(self) -> None:
+        self._wfile.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+def send_message(wfile, message: dict) -> None:
+    wfile.write(json.dumps(message).encode() + b'\n')
+
+
+def exit_status(code) -> int:
+    """Exit status of a SystemExit code, like the interpreter"""
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Runs one command line on the daemon's warm CliCommand, streaming its output back
+    Request:    one JSON line {argv, cwd, columns, color}
+    Response:   JSON lines {out: text}, then {exit: status}
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # Connection closed without a request: another daemon checking this one is alive
+            return
+        request = json.loads(line)
+        status = self.server.execute(request, SocketWriter(self.wfile))
+        send_message(self.wfile, {'exit': status})
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """Resident process holding a warm GoogleCalendarManager (credentials, service, HTTP transports,
+    calendar list, event store and caches) for CLI invocations in client mode.
+    Requests are served one at a time: commands print to the process wide sys.stdout.
+    The calendar list is fetched again once older than DAEMON_CALENDARS_MAX_AGE, for calendars created or renamed meanwhile.
+    """
+
+    def __init__(self, cli_commands, parser, socket_path: str = DAEMON_SOCKET_PATH) -> None:
+        self.cli_commands = cli_commands
+        self.parser = parser
+        self.socket_path = socket_path
+        self._calendars_loaded = time.monotonic()
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.exists(socket_path):
+            if is_listening(socket_path):
+                print('ERROR: a gcaltools daemon is already running on {}'.format(socket_path))
+                exit()
+            # Left behind by a daemon which did not stop cleanly
+            os.remove(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def execute(self, request: dict, output) -> int:
+        try:
+            args = self.parser.parse_args(request['argv'])
+        except SystemExit as e:
+            # argparse prints usage on stderr
+            return exit_status(e.code)
+
+        calendar_manager = self.cli_commands.calendar_manager
+        if time.monotonic() - self._calendars_loaded > DAEMON_CALENDARS_MAX_AGE:
+            calendar_manager.reload_calendars()
+            self._calendars_loaded = time.monotonic()
+        traffic = calendar_manager.traffic
+        environ = dict(os.environ)
+        cwd = os.getcwd()
+        stdout = sys.stdout
+        try:
+            os.chdir(request['cwd'])
+            # rich renders for the client terminal
+            os.environ['COLUMNS'] = str(request['columns'])
+            if request['color']:
+                os.environ['FORCE_COLOR'] = '1'
+            if args.debug_bytes and traffic is not None:
+                traffic.reset()
+            else:
+                calendar_manager.traffic = None
+            sys.stdout = output
+            self.cli_commands.execute_cmd(args.command, args)
+            return 0
+        except SystemExit as e:
+            return exit_status(e.code)
+        except Exception:
+            print(traceback.format_exc(), end='')
+            return 1
+        finally:
+            sys.stdout = stdout
+            calendar_manager.traffic = traffic
+            os.environ.clear()
+            os.environ.update(environ)
+            os.chdir(cwd)
+
+    def run(self) -> None:
+        # Fixed startup work is done once: authentication, discovery, calendar list, event store
+        self.cli_commands.calendar_manager.service
+        self.cli_commands.calendar_manager.http_pool
+        self.cli_commands.calendar_manager.calendars
+        self._calendars_loaded = time.monotonic()
+        self.cli_commands.calendar_manager.event_store
+        print('gcaltools daemon listening on {}'.format(self.socket_path))
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            os.remove(self.socket_path)
+
+
+def is_listening(socket_path: str) -> bool:
+    """Return True if a process accepts connections on socket_path, False for a stale socket file
+    Sockets which cannot be checked (ie: permissions) count as listening, they are never removed.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    except OSError:
+        return True
+    finally:
+        probe.close()
+    return True
+
+
+def run_client(argv: list, socket_path: str = DAEMON_SOCKET_PATH) -> int or None:
+    """Runs command line on the daemon and prints its output, returns the exit status
+    Returns None if no daemon is listening on socket_path.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        return None
+
+    try:
+        columns = os.get_terminal_size(sys.stdout.fileno()).columns
+    except (OSError, ValueError):
+        columns = 80
+    request = {'argv': argv, 'cwd': os.getcwd(), 'columns': columns, 'color': sys.stdout.isatty()}
+
+    with client, client.makefile('rwb') as stream:
+        send_message(stream, request)
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if 'out' in message:
+                sys.stdout.write(message['out'])
+                sys.stdout.flush()
+            else:
+                return message['exit']
+    print('ERROR: gcaltools daemon closed the connection')
+    return 1
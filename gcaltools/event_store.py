@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from gcaltools.config import COLORS
+from pytz import timezone, utc
+
+STORE_KEY_FORMAT = "%Y-%m-%dT%H:%M:%S"
+COLOR_NAMES = {str(color_id): name for name, color_id in COLORS.items()}
+
+
+def store_key(moment: datetime) -> str:
+    """Returns sortable UTC key for a timezone aware datetime"""
+    return moment.astimezone(utc).strftime(STORE_KEY_FORMAT)
+
+
+def event_bounds(event, time_zone: str):
+    """Returns (start, end) store keys for full day length event or specific time event"""
+    bounds = []
+    for edge in (event['start'], event['end']):
+        if 'dateTime' in edge:
+            bounds.append(store_key(datetime.fromisoformat(edge['dateTime'])))
+        else:
+            bounds.append(store_key(timezone(time_zone).localize(datetime.fromisoformat(edge['date']))))
+    return tuple(bounds)
+
+
+def search_document(event) -> tuple:
+    """Returns (summary, description, attendees, color) text indexed for an event"""
+    attendees = ' '.join('{} {}'.format(a['email'], a.get('displayName', '')).strip() for a in event.get('attendees', []))
+    return event.get('summary', ''), event.get('description', ''), attendees, COLOR_NAMES.get(str(event.get('colorId')), '')
+
+
+def _quote(text: str) -> str:
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+def search_query(text: str, attendees_dict: dict = None) -> str:
+    """Returns FTS5 query matching all words, "quoted phrases" and prefix* words of text
+    Words and phrases also match attendees whose display name in attendees_dict contains them.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        prefix = word.endswith('*')
+        term = phrase if phrase else word.rstrip('*')
+        if not term:
+            continue
+        alternatives = [_quote(term) + ('*' if prefix else '')]
+        for email, name in (attendees_dict or {}).items():
+            name = ' {} '.format(str(name).lower())
+            if ' {}{}'.format(term.lower(), '' if prefix else ' ') in name:
+                alternatives.append('attendees : {}'.format(_quote(email)))
+        terms.append('({})'.format(' OR '.join(alternatives)) if len(alternatives) > 1 else alternatives[0])
+    return ' AND '.join(terms)
+
+
+class EventStore:
+    """Local SQLite copy of calendar events
+    Kept current through the events.list syncToken delta feed
+    """
+    store_file_path = os.path.join(os.path.expanduser('~'), '.gcaltools/events.db')
+
+    def __init__(self, store_file_path: str = None) -> None:
+        if store_file_path is not None:
+            self.store_file_path = store_file_path
+        # Connection is shared by sync workers, writes are serialized with _lock
+        self._db = sqlite3.connect(self.store_file_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Reads use a connection per thread (see __reader)
+        self._readers = threading.local()
+        # Write-ahead log: readers see the last committed changes while a sync writes, without blocking it
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, event_id)
+            );
+            CREATE INDEX IF NOT EXISTS events_calendar_start ON events (calendar_id, start);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT,
+                synced_at TEXT
+            );
+        """)
+        self.__create_search_index()
+
+    def __create_search_index(self) -> None:
+        """Full text index of events, rows share the rowid of their events row"""
+        if self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'events_fts'").fetchone() is not None:
+            return
+        with self._db:
+            self._db.execute('CREATE VIRTUAL TABLE events_fts USING fts5(summary, description, attendees, color)')
+            # Stores synced before the index existed are indexed once
+            for rowid, data in self._db.execute('SELECT rowid, data FROM events').fetchall():
+                self._db.execute('INSERT INTO events_fts (rowid, summary, description, attendees, color) VALUES (?, ?, ?, ?, ?)', (rowid,) + search_document(json.loads(data)))
+
+    def __reader(self) -> sqlite3.Connection:
+        """Returns read connection of the current thread
+        Background jobs and the foreground command read while sync workers write: each thread reads through
+        its own connection, never through the shared write connection.
+        """
+        db = getattr(self._readers, 'db', None)
+        if db is None:
+            # Generators may be resumed by another thread than the one which started them
+            db = self._readers.db = sqlite3.connect(self.store_file_path, check_same_thread=False)
+        return db
+
+    def __unindex(self, calendar_id: str, event_id: str = None) -> None:
+        query = 'DELETE FROM events_fts WHERE rowid IN (SELECT rowid FROM events WHERE calendar_id = ?{})'.format('' if event_id is None else ' AND event_id = ?')
+        self._db.execute(query, (calendar_id,) if event_id is None else (calendar_id, event_id))
+
+    def sync_token(self, calendar_id: str) -> str or None:
+        """Returns last sync token stored for calendar, or None if never synced"""
+        with self._lock:
+            row = self._db.execute('SELECT sync_token FROM sync_state WHERE calendar_id = ?', (calendar_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def is_synced(self, calendar_id: str) -> bool:
+        """Return True if calendar has been synced at least once"""
+        return self.sync_token(calendar_id) is not None
+
+    def apply_changes(self, calendar_id: str, events, time_zone: str, sync_token: str = None, reset: bool = False) -> None:
+        """Applies one page of the events feed
+        Cancelled events are removed, others are inserted or replaced.
+        reset:       drop every stored event of the calendar first (full sync)
+        sync_token:  stored once the last page of the feed is applied
+        """
+        with self._lock, self._db:
+            if reset:
+                self.__unindex(calendar_id)
+                self._db.execute('DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+                # Until the last page is applied, an interrupted full sync must start over, not resume incrementally
+                self._db.execute('DELETE FROM sync_state WHERE calendar_id = ?', (calendar_id,))
+            for event in events:
+                self.__unindex(calendar_id, event['id'])
+                if event.get('status') == 'cancelled':
+                    self._db.execute('DELETE FROM events WHERE calendar_id = ? AND event_id = ?', (calendar_id, event['id']))
+                else:
+                    start, end = event_bounds(event, time_zone)
+                    cursor = self._db.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)', (calendar_id, event['id'], start, end, json.dumps(event)))
+                    self._db.execute('INSERT INTO events_fts (rowid, summary, description, attendees, color) VALUES (?, ?, ?, ?, ?)', (cursor.lastrowid,) + search_document(event))
+            if sync_token is not None:
+                self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)', (calendar_id, sync_token, store_key(datetime.now(utc))))
+
+    def iter_events(self, calendar_id: str, time_min: datetime = None, time_max: datetime = None):
+        """Yield stored events overlapping [time_min, time_max[ sorted by start time"""
+        query = 'SELECT data FROM events WHERE calendar_id = ?'
+        params = [calendar_id]
+        if time_max is not None:
+            query += ' AND start < ?'
+            params.append(store_key(time_max))
+        if time_min is not None:
+            query += ' AND end > ?'
+            params.append(store_key(time_min))
+        query += ' ORDER BY start'
+        for (data,) in self.__reader().execute(query, params):
+            yield json.loads(data)
+
+    def search(self, query: str, calendar_ids: list, time_min: datetime = None, time_max: datetime = None, limit: int = None):
+        """Yield (calendar_id, event) of stored events matching FTS5 query, sorted by start time"""
+        # Matching rowids are collected from the index first, then sorted by start
+        sql = 'SELECT e.calendar_id, e.data FROM events e WHERE e.rowid IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)'
+        params = [query]
+        sql += ' AND e.calendar_id IN ({})'.format(', '.join('?' * len(calendar_ids)))
+        params += calendar_ids
+        if time_max is not None:
+            sql += ' AND e.start < ?'
+            params.append(store_key(time_max))
+        if time_min is not None:
+            sql += ' AND e.end > ?'
+            params.append(store_key(time_min))
+        sql += ' ORDER BY e.start'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        for calendar_id, data in self.__reader().execute(sql, params):
+            yield calendar_id, json.loads(data)
+
+    def clear(self, calendar_id: str = None) -> None:
+        """Remove stored events and sync state of one or all calendars"""
+        with self._lock, self._db:
+            if calendar_id is None:
+                self._db.execute('DELETE FROM events_fts')
+                self._db.execute('DELETE FROM events')
+                self._db.execute('DELETE FROM sync_state')
+            else:
+                self.__unindex(calendar_id)
+                self._db.execute('DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+                self._db.execute('DELETE FROM sync_state WHERE calendar_id = ?', (calendar_id,))
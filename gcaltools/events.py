@@ -0,0 +1,91 @@
+import threading
+from datetime import datetime
+from enum import IntEnum
+
+from gcaltools.config import COLORS
+
+Color = IntEnum('Color', {name.upper(): color_id for name, color_id in COLORS.items()})
+
+
+class AttendeeRegistry:
+    """Interns attendee emails to small integer ids shared by all events of a run"""
+
+    def __init__(self) -> None:
+        self._ids = {}
+        self._emails = []
+        self._lock = threading.Lock()
+
+    def id(self, email: str) -> int:
+        attendee_id = self._ids.get(email)
+        if attendee_id is None:
+            with self._lock:
+                attendee_id = self._ids.setdefault(email, len(self._emails))
+                if attendee_id == len(self._emails):
+                    self._emails.append(email)
+        return attendee_id
+
+    def email(self, attendee_id: int) -> str:
+        return self._emails[attendee_id]
+
+
+ATTENDEES = AttendeeRegistry()
+
+
+def _edge(edge, time_zone) -> datetime:
+    if 'dateTime' in edge:
+        return datetime.fromisoformat(edge['dateTime'])
+    return time_zone.localize(datetime.fromisoformat(edge['date']))
+
+
+class Event:
+    """Calendar event parsed once from its API representation
+    start, end:     timezone aware datetimes, midnight in the given time zone for all day events
+    attendees:      interned attendee ids (see ATTENDEES)
+    declined:       ids of attendees who declined the invitation
+    color:          Color, None for the calendar color
+    """
+    __slots__ = ('id', 'uid', 'summary', 'description', 'start', 'end', 'all_day', 'attendees', 'declined', 'color')
+
+    def __init__(self, id, uid, summary, description, start, end, all_day, attendees=(), declined=(), color=None) -> None:
+        self.id = id
+        self.uid = uid
+        self.summary = summary
+        self.description = description
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+        self.attendees = attendees
+        self.declined = declined
+        self.color = color
+
+    @classmethod
+    def from_api(cls, item: dict, time_zone):
+        """Returns event record of an events resource, time_zone (pytz) localizes all day events"""
+        attendees = ()
+        declined = ()
+        if 'attendees' in item:
+            attendees = tuple(ATTENDEES.id(a['email']) for a in item['attendees'])
+            declined = tuple(ATTENDEES.id(a['email']) for a in item['attendees'] if a.get('responseStatus') == 'declined')
+        return cls(
+            item.get('id'),
+            item.get('iCalUID', item.get('id')),
+            item.get('summary', ''),
+            item.get('description', ''),
+            _edge(item['start'], time_zone),
+            _edge(item['end'], time_zone),
+            'dateTime' not in item['start'],
+            attendees,
+            declined,
+            Color(int(item['colorId'])) if 'colorId' in item else None,
+        )
+
+    @property
+    def attendee_emails(self) -> list:
+        return [ATTENDEES.email(a) for a in self.attendees]
+
+    @property
+    def booked_attendees(self) -> tuple:
+        """Ids of attendees who did not decline the event"""
+        if not self.declined:
+            return self.attendees
+        return tuple(a for a in self.attendees if a not in self.declined)
@@ -1,25 +1,34 @@
 import os
-import yaml
-from gcaltools import gcal_tool
+import threading
+import time
 from datetime import datetime, timedelta
-from gcaltools.config import SCOPES, COLORS
+from gcaltools import jobs, profiler
+from gcaltools.events import Event
+from gcaltools.scheduler import RequestScheduler, is_throttle_error, is_transient_error
+from gcaltools.utils import YamlFile
+from gcaltools.config import SCOPES, COLORS, EVENTS_PAGE_SIZE, EVENTS_SYNC_PAGE_SIZE, BATCH_MAX_ATTEMPTS, FREEBUSY_MAX_ITEMS, FREEBUSY_MAX_DAYS, MAX_WORKERS, HTTP_POOL_SIZE, HTTP_TIMEOUT
+from gcaltools.config import CALENDAR_LIST_FIELDS, EVENTS_LIST_FIELDS, EVENTS_SYNC_FIELDS, EVENT_INSERT_FIELDS, FREEBUSY_FIELDS
 from pytz import timezone
 
 
-def event_start(event):
-    """Returns start time for full day length event or specific time event"""
-    if 'date' in event['start'].keys():
-        return event['start']['date']
-    else:
-        return event['start']['dateTime']
+class FreeBusyError(Exception):
+    """Busy intervals of some attendees could not be fetched, failures lists the API errors"""
 
+    def __init__(self, failures: list) -> None:
+        super().__init__('; '.join(str(failure) for failure in failures))
+        self.failures = failures
 
-def _create_service(noauth_local_webserver: bool = False):
+
+def _create_service(noauth_local_webserver: bool = False, discovery_filename: str = None, cache=None, api_root: str = None):
     """Initialize Google Calendar service"""
+    # Google API client libraries are only loaded once a network call happens
+    with profiler.phase('imports'):
+        from gcaltools import gcal_tool
+        from gcaltools.api_model import CachedJsonModel
     args = ['']
     if noauth_local_webserver:
         args.append('--noauth_local_webserver')
-    return gcal_tool.init(args, 'calendar', 'v3', __doc__, __file__, scope=SCOPES)
+    return gcal_tool.init(args, 'calendar', 'v3', __doc__, __file__, scope=SCOPES, discovery_filename=discovery_filename, cache=cache, model=CachedJsonModel(), api_root=api_root)
 
 
 class GoogleCalendarManager:
@@ -28,22 +37,76 @@ class GoogleCalendarManager:
     """
     defaults_file_path = os.path.join(os.path.expanduser('~'), '.gcaltools/.defaults')
 
-    def __init__(self, use_api: bool = True, remote_auth: bool = False) -> None:
-        if use_api:
-            self._service, self._flags = _create_service(noauth_local_webserver=remote_auth)
-            self._calendars = self.__get_calendars()['items']
+    def __init__(self, use_api: bool = True, remote_auth: bool = False, discovery_filename: str = None, traffic=None, api_root: str = None) -> None:
+        self._use_api = use_api
+        self._remote_auth = remote_auth
+        self._discovery_filename = discovery_filename
+        # Local stand-in of the Calendar API (see benchmarks/fake_calendar_server.py), None for Google's
+        self._api_root = api_root if api_root is not None else os.environ.get('GCALTOOLS_API_ROOT')
+        self._service = None
+        self._flags = None
+        self._credentials = None
+        self._response_cache = None
+        self._http_pool = None
+        self._scheduler = None
+        self._calendars = None
+        self._event_store = None
+        # Syncs of the same calendar are serialized, ie: background prefetch and a command
+        self._sync_locks = {}
+        self._sync_locks_lock = threading.Lock()
+        # transport.TrafficStats collecting responses size, None when not debugging
+        self.traffic = traffic
         self.__load_user_preferences()
 
+    @property
+    def service(self):
+        """Google Calendar API service, authenticated and built on first use"""
+        if self._service is None:
+            if not self._use_api:
+                raise RuntimeError('Google Calendar API disabled for this calendar manager')
+            from gcaltools.http_cache import ResponseCache
+            self._response_cache = ResponseCache()
+            self._service, self._flags, self._credentials = _create_service(noauth_local_webserver=self._remote_auth, discovery_filename=self._discovery_filename, cache=self._response_cache, api_root=self._api_root)
+        return self._service
+
+    @property
+    def http_pool(self):
+        """Pool of authorized keep-alive HTTP transports, shared by all threads"""
+        if self._http_pool is None:
+            from gcaltools.transport import HttpPool
+            self.authenticate()
+            self._http_pool = HttpPool(self._credentials, size=self.http_pool_size, timeout=self.http_timeout, gzip=self.http_gzip, cache=self._response_cache, traffic=self.traffic)
+        return self._http_pool
+
+    @property
+    def scheduler(self):
+        """Rate limiter and retry policy of all API requests, shared by all threads"""
+        if self._scheduler is None:
+            self._scheduler = RequestScheduler(self.http_pool)
+        return self._scheduler
+
+    def __execute(self, request, duplicate_ok: bool = False, prepaid: bool = False):
+        """Execute API request through the scheduler, on a transport borrowed from the pool"""
+        jobs.check_cancelled()
+        with profiler.request(request):
+            return self.scheduler.execute(request, duplicate_ok=duplicate_ok, prepaid=prepaid)
+
+    def authenticate(self) -> None:
+        """Run Google OAuth2 flow now if no valid credentials are stored yet"""
+        self.service
+
     def __load_user_preferences(self) -> None:
         """Loads user preferences and default settings from .yaml file"""
-        if os.path.exists(self.defaults_file_path):
-            with open(self.defaults_file_path) as file:
-                self._preferences = yaml.load(file, Loader=yaml.FullLoader)
+        self._preferences_file = YamlFile(self.defaults_file_path)
+        if self._preferences_file.exists():
+            self._preferences = self._preferences_file.load()
         else:
+            # HTTP settings are read from preferences while the calendar list is fetched
+            self._preferences = {}
             self._preferences = {
                 'default_calendar': None,
                 'default_duration': 60,
-                'default_timezone': self._calendars[0]['timeZone'],
+                'default_timezone': self.calendars[0]['timeZone'],
                 'attendees_catalog': None,
             }
 
@@ -51,10 +114,14 @@ class GoogleCalendarManager:
         """Reload user preferences and default settings"""
         self.__load_user_preferences()
 
+    def refresh_user_preferences(self) -> None:
+        """Reload user preferences if the .yaml file changed since it was read or written"""
+        if self._preferences_file.changed():
+            self.__load_user_preferences()
+
     def __save_user_preferences(self) -> None:
         """Write user preferences and defaulty settings to .yaml file"""
-        with open(self.defaults_file_path, 'w') as file:
-            yaml.dump(self._preferences, file)
+        self._preferences_file.save(self._preferences)
 
     def __set_user_preference(self, setting: str, value) -> None:
         """Set user preference or default setting"""
@@ -101,57 +168,223 @@ class GoogleCalendarManager:
     def default_timezone(self, time_zone: str) -> None:
         self.__set_user_preference('default_timezone', time_zone)
 
+    @property
+    def http_pool_size(self) -> int:
+        return self._preferences.get('http_pool_size', HTTP_POOL_SIZE)
+
+    @http_pool_size.setter
+    def http_pool_size(self, size: int) -> None:
+        self.__set_user_preference('http_pool_size', size)
+
+    @property
+    def http_timeout(self) -> int:
+        return self._preferences.get('http_timeout', HTTP_TIMEOUT)
+
+    @http_timeout.setter
+    def http_timeout(self, timeout: int) -> None:
+        self.__set_user_preference('http_timeout', timeout)
+
+    @property
+    def http_gzip(self) -> bool:
+        return self._preferences.get('http_gzip', True)
+
+    @http_gzip.setter
+    def http_gzip(self, gzip: bool) -> None:
+        self.__set_user_preference('http_gzip', gzip)
+
     def get_user_preferences(self) -> dict:
         """Returns user preferences and default settings"""
         return self._preferences
 
     def __get_calendar_id(self, calendar_name: str) -> str or None:
-        for cal in self._calendars:
+        for cal in self.calendars:
             if cal['summary'] == calendar_name:
                 return cal['id']
         else:
             return None
 
-    def __get_calendars(self):
-        return self._service.calendarList().list().execute()
+    def __get_calendars(self) -> list:
+        calendars = []
+        page_token = None
+        while True:
+            page = self.__execute(self.service.calendarList().list(pageToken=page_token, fields=CALENDAR_LIST_FIELDS))
+            calendars += page.get('items', [])
+            page_token = page.get('nextPageToken')
+            if page_token is None:
+                return calendars
+
+    @property
+    def calendars(self) -> list:
+        """Available calendars, fetched on first use"""
+        if self._calendars is None:
+            # Authentication and discovery are profiled on their own
+            self.service
+            with profiler.phase('calendarList'):
+                self._calendars = self.__get_calendars()
+        return self._calendars
+
+    def reload_calendars(self) -> None:
+        """Drops the calendar list, fetched again on next use"""
+        self._calendars = None
 
     def calendar_exists(self, calendar_name: str) -> bool:
         """Return True if given calendar exists, or False if not."""
         return True if self.__get_calendar_id(calendar_name) is not None else False
 
-    def get_events(self, calendar_name: str, order_by=None, time_min=None, time_max=None, max_results=None):
-        """Return list of events
+    def iter_events(self, calendar_name: str, time_min=None, time_max=None, page_size: int = EVENTS_PAGE_SIZE, fields: str = EVENTS_LIST_FIELDS):
+        """Yield events sorted by start time, one page at a time
         calendar_name:  Google Calendar Name        ->  str
-        order_by:       Sort events by...           ->  str
         time_min:       first date                  -> datetime()
         time_max:       last date                   -> datetime()
-        max_results:    maximum number of events    -> int
+        page_size:      events per API page         -> int
+        fields:         partial response mask       -> str
+
+        Recurring events are expanded into single instances so the API can order them by start time.
+        The next page is requested in the background while the current one is being consumed.
         """
+        from concurrent.futures import ThreadPoolExecutor
         if time_max is not None:
             time_max = timezone(self.default_timezone).localize(time_max).isoformat()
 
         if time_min is not None:
             time_min = timezone(self.default_timezone).localize(time_min).isoformat()
 
-        event_list = self._service.events().list(calendarId=self.__get_calendar_id(calendar_name), orderBy=order_by, timeMin=time_min, timeMax=time_max, maxResults=max_results).execute()['items']
-        return sorted(event_list, key=lambda e: event_start(e))
+        def fetch_page(page_token):
+            return self.__execute(self.service.events().list(calendarId=calendar_id, orderBy='startTime', singleEvents=True, timeMin=time_min, timeMax=time_max, maxResults=page_size, pageToken=page_token, fields=fields))
+
+        calendar_id = self.__get_calendar_id(calendar_name)
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            page = fetch_page(None)
+            while True:
+                next_page_token = page.get('nextPageToken')
+                next_page = prefetcher.submit(fetch_page, next_page_token) if next_page_token else None
+                yield from page.get('items', [])
+                if next_page is None:
+                    break
+                page = next_page.result()
+
+    def get_events(self, calendar_name: str, time_min=None, time_max=None, fields: str = EVENTS_LIST_FIELDS):
+        """Return list of all events sorted by start time
+        calendar_name:  Google Calendar Name        ->  str
+        time_min:       first date                  -> datetime()
+        time_max:       last date                   -> datetime()
+        fields:         partial response mask       -> str
+        """
+        return list(self.iter_events(calendar_name, time_min=time_min, time_max=time_max, fields=fields))
+
+    @property
+    def event_store(self):
+        """Local event store, opened on first use"""
+        if self._event_store is None:
+            from gcaltools.event_store import EventStore
+            self._event_store = EventStore()
+        return self._event_store
+
+    def sync_events(self, calendar_name: str, full: bool = False) -> None:
+        """Bring local event store up to date for given calendar
+        Only changes since the last sync are transferred, unless full is True or the sync token expired.
+        """
+        calendar_id = self.__get_calendar_id(calendar_name)
+        with self._sync_locks_lock:
+            sync_lock = self._sync_locks.setdefault(calendar_id, threading.Lock())
+        with sync_lock, profiler.phase('sync'):
+            self.__sync_events(calendar_id, full)
+
+    def __sync_events(self, calendar_id: str, full: bool) -> None:
+        from googleapiclient.errors import HttpError
+        sync_token = None if full else self.event_store.sync_token(calendar_id)
+        page_token = None
+        reset = sync_token is None
+        while True:
+            try:
+                page = self.__execute(self.service.events().list(calendarId=calendar_id, singleEvents=True, syncToken=sync_token, pageToken=page_token, maxResults=EVENTS_SYNC_PAGE_SIZE, fields=EVENTS_SYNC_FIELDS))
+            except HttpError as error:
+                if error.resp.status == 410 and sync_token is not None:
+                    # Sync token expired: start over with a full sync
+                    return self.__sync_events(calendar_id, full=True)
+                raise
+            self.event_store.apply_changes(calendar_id, page.get('items', []), self.default_timezone, sync_token=page.get('nextSyncToken'), reset=reset)
+            reset = False
+            page_token = page.get('nextPageToken')
+            if page_token is None:
+                break
+
+    def sync_calendars(self, calendar_names: list, full: bool = False, max_workers: int = MAX_WORKERS) -> None:
+        """Bring local event store up to date for several calendars concurrently"""
+        from concurrent.futures import ThreadPoolExecutor
+        # Calendar list and event store are loaded once, before workers use them
+        self.calendars
+        self.event_store
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calendar_names)))) as workers:
+            for sync in [workers.submit(jobs.in_current_job(self.sync_events), name, full) for name in calendar_names]:
+                sync.result()
+
+    def iter_stored_events(self, calendar_name: str, time_min=None, time_max=None, refresh: bool = False, offline: bool = False):
+        """Yield events records (see events.Event) sorted by start time from the local event store
+        calendar_name:  Google Calendar Name                    ->  str
+        time_min:       first date                              -> datetime()
+        time_max:       last date                               -> datetime()
+        refresh:        drop local copy and sync from scratch   -> bool
+        offline:        skip sync, use local copy as is         -> bool
+        """
+        calendar_id = self.__get_calendar_id(calendar_name)
+        if not offline:
+            self.sync_events(calendar_name, full=refresh)
+        elif not self.event_store.is_synced(calendar_id):
+            print('WARNING: calendar {} has never been synced, no local events available.'.format(calendar_name))
+
+        time_zone = timezone(self.default_timezone)
+        if time_max is not None:
+            time_max = time_zone.localize(time_max)
+
+        if time_min is not None:
+            time_min = time_zone.localize(time_min)
+
+        events = (Event.from_api(item, time_zone) for item in self.event_store.iter_events(calendar_id, time_min=time_min, time_max=time_max))
+        for event in profiler.timed_iter('events.read', events):
+            jobs.check_cancelled()
+            yield event
+
+    def search_stored_events(self, calendar_names: list, query: str, time_min=None, time_max=None, limit: int = None):
+        """Yield (calendar_name, event record) of locally stored events matching a full text query, sorted by start time
+        calendar_names: Google Calendar Names                   ->  list
+        query:          FTS5 query (see event_store.search_query) -> str
+        time_min:       first date                              -> datetime()
+        time_max:       last date                               -> datetime()
+        """
+        calendar_names_by_id = {self.__get_calendar_id(name): name for name in calendar_names}
+        for calendar_id, calendar_name in calendar_names_by_id.items():
+            if not self.event_store.is_synced(calendar_id):
+                print('WARNING: calendar {} has never been synced, no local events available.'.format(calendar_name))
+
+        time_zone = timezone(self.default_timezone)
+        if time_max is not None:
+            time_max = time_zone.localize(time_max)
+
+        if time_min is not None:
+            time_min = time_zone.localize(time_min)
+
+        for calendar_id, item in self.event_store.search(query, list(calendar_names_by_id), time_min=time_min, time_max=time_max, limit=limit):
+            yield calendar_names_by_id[calendar_id], Event.from_api(item, time_zone)
 
     def get_calendars(self, sort_by_summary: bool = True):
         """Return list of available calendars"""
         if sort_by_summary:
-            return sorted(self._calendars, key=lambda c: c['summary'])
+            return sorted(self.calendars, key=lambda c: c['summary'])
         else:
-            return self._calendars
+            return self.calendars
 
-    def insert_event(self, calendar_name: str, title: str, start_date: datetime, start_time: datetime, duration: int = None, attendees=None, color_name=None):
-        """Inserts new event in calendar"""
-        calendar_id = self.__get_calendar_id(calendar_name)
+    def event_body(self, title: str, start_date: datetime, start_time: datetime, duration: int = None, attendees=None, color_name=None) -> dict:
+        """Returns API body of a new event"""
+        import uuid
         if duration is None:
             duration = self.default_event_duration
         body_start_time = timezone(self.default_timezone).localize(start_date + timedelta(hours=start_time.hour, minutes=start_time.minute))
         body_end_time = body_start_time + timedelta(minutes=duration)
 
         body = {
+            # Client side id makes retried inserts idempotent
+            'id': uuid.uuid4().hex,
             'summary': title,
             'start': {'dateTime': body_start_time.isoformat(), 'timZone': self.default_timezone},
             'end': {'dateTime': body_end_time.isoformat()},
@@ -163,7 +396,134 @@ class GoogleCalendarManager:
         if color_name is not None:
             body['colorId'] = COLORS[color_name]
 
-        self._service.events().insert(calendarId=calendar_id, body=body).execute()
+        return body
+
+    def insert_event(self, calendar_name: str, title: str, start_date: datetime, start_time: datetime, duration: int = None, attendees=None, color_name=None):
+        """Inserts new event in calendar"""
+        calendar_id = self.__get_calendar_id(calendar_name)
+        body = self.event_body(title, start_date, start_time, duration, attendees, color_name)
+        # Event id is set client side: a retried insert already done fails with 409
+        self.__execute(self.service.events().insert(calendarId=calendar_id, body=body, fields=EVENT_INSERT_FIELDS), duplicate_ok=True)
+
+    def insert_events(self, calendar_name: str, bodies: list, max_attempts: int = BATCH_MAX_ATTEMPTS, progress=None) -> list:
+        """Inserts events in calendar through batch requests
+        calendar_name:  Google Calendar Name                    ->  str
+        bodies:         events API bodies (see event_body)      ->  list
+        max_attempts:   attempts for transient failures         ->  int
+        progress:       called with events count of each batch  ->  callable
+
+        Returns one error per body, in the same order: None if the event was created, else the HttpError.
+        Batches of scheduler.batch_size events are sent concurrently over the HTTP transports pool.
+        Only failed sub-requests are retried, transient errors (rate limit, server errors) only.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from googleapiclient.errors import HttpError
+        calendar_id = self.__get_calendar_id(calendar_name)
+        errors = [None] * len(bodies)
+        pending = list(range(len(bodies)))
+
+        def on_response(request_id, response, exception):
+            index = int(request_id)
+            if exception is not None and not (isinstance(exception, HttpError) and exception.resp.status == 409):
+                # 409: event ids are set client side, the event was created by a previous attempt,
+                # ie: a retried round or a batch resent by the scheduler after a timeout
+                errors[index] = exception
+                if is_throttle_error(exception):
+                    self.scheduler.throttle()
+            else:
+                errors[index] = None
+
+        def send_batch(indexes):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for index in indexes:
+                batch.add(self.service.events().insert(calendarId=calendar_id, body=bodies[index], fields=EVENT_INSERT_FIELDS), request_id=str(index))
+            self.__execute(batch, prepaid=True)
+            if progress is not None and attempt == 0:
+                progress(len(indexes))
+
+        def send_pending(queue):
+            while True:
+                # Workers are admitted one at a time, the next batch is cut at the current batch size
+                with queue_lock:
+                    if not queue:
+                        return
+                    size = self.scheduler.acquire_batch(len(queue))
+                    indexes = queue[:size]
+                    del queue[:size]
+                send_batch(indexes)
+
+        queue_lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=self.http_pool_size) as workers:
+            for attempt in range(max_attempts):
+                if attempt > 0:
+                    profiler.record_retry('batch:calendar.events.insert', len(pending))
+                    time.sleep(self.scheduler.backoff(attempt - 1))
+                queue = list(pending)
+                for sent in [workers.submit(jobs.in_current_job(send_pending), queue) for _ in range(self.http_pool_size)]:
+                    sent.result()
+                pending = [i for i in pending if errors[i] is not None and is_transient_error(errors[i])]
+                if not pending:
+                    break
+
+        return errors
+
+    def free_busy(self, emails: list, time_min: datetime, time_max: datetime) -> dict:
+        """Returns busy intervals of each email between time_min and time_max
+        emails:         attendees (or calendar ids)             ->  list
+        time_min:       first moment, default time zone         ->  datetime()
+        time_max:       last moment, default time zone          ->  datetime()
+
+        Returns {email: [(start, end), ...]} with timezone aware datetimes.
+        Queries are split by FREEBUSY_MAX_ITEMS calendars and FREEBUSY_MAX_DAYS days and sent as batch requests.
+        Raises FreeBusyError if any query or calendar failed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        time_zone = timezone(self.default_timezone)
+        time_min = time_zone.localize(time_min)
+        time_max = time_zone.localize(time_max)
+        busy = {email: [] for email in emails}
+        failures = []
+
+        queries = []
+        window_start = time_min
+        while window_start < time_max:
+            window_end = min(time_max, window_start + timedelta(days=FREEBUSY_MAX_DAYS))
+            for i in range(0, len(emails), FREEBUSY_MAX_ITEMS):
+                queries.append({
+                    'timeMin': window_start.isoformat(),
+                    'timeMax': window_end.isoformat(),
+                    'timeZone': self.default_timezone,
+                    'items': [{'id': email} for email in emails[i:i + FREEBUSY_MAX_ITEMS]],
+                })
+            window_start = window_end
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                failures.append(exception)
+                if is_throttle_error(exception):
+                    self.scheduler.throttle()
+                return
+            for email, calendar in response['calendars'].items():
+                for error in calendar.get('errors', []):
+                    failures.append('{}: {}'.format(email, error.get('reason')))
+                busy[email].extend((datetime.fromisoformat(b['start']), datetime.fromisoformat(b['end'])) for b in calendar.get('busy', []))
+
+        def send_batch(chunk):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for body in chunk:
+                batch.add(self.service.freebusy().query(body=body, fields=FREEBUSY_FIELDS))
+            self.__execute(batch)
+
+        batch_size = self.scheduler.batch_size
+        chunks = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+        with ThreadPoolExecutor(max_workers=self.http_pool_size) as workers:
+            for sent in [workers.submit(jobs.in_current_job(send_batch), chunk) for chunk in chunks]:
+                sent.result()
+
+        if failures:
+            raise FreeBusyError(failures)
+
+        return busy
 
 
 if __name__ == "__main__":
@@ -8,14 +8,101 @@
 from __future__ import absolute_import
 
 import argparse
+import json
 import os
 
-from googleapiclient import discovery
+from googleapiclient import discovery, discovery_cache
 from googleapiclient.http import build_http
+from googleapiclient.version import __version__ as client_version
+
+from gcaltools import profiler
+
+DISCOVERY_DIR = os.path.join(os.path.expanduser('~'), ".gcaltools", "discovery")
+
+# Calendar API resources used by gcaltools, others are dropped from the cached discovery document
+DISCOVERY_RESOURCES = ['calendarList', 'calendars', 'colors', 'events', 'freebusy', 'settings']
+
+
+def _compact(node):
+    """Strip human readable descriptions from a discovery document node"""
+    if isinstance(node, dict):
+        return {k: _compact(v) for k, v in node.items() if not (k == 'description' and isinstance(v, str))}
+    if isinstance(node, list):
+        return [_compact(v) for v in node]
+    return node
+
+
+def load_discovery_document(name, version):
+    """Returns compact discovery document from local cache, or None if not available.
+
+  The document is derived from the static copy bundled with googleapiclient and
+  regenerated whenever googleapiclient is upgraded.
+  """
+    cache_path = os.path.join(DISCOVERY_DIR, "{}.{}.json".format(name, version))
+    try:
+        with open(cache_path) as cache_file:
+            document = json.load(cache_file)
+        if document.get('gcaltoolsClientVersion') == client_version:
+            return document
+    except (OSError, ValueError):
+        pass
+
+    content = discovery_cache.get_static_doc(name, version)
+    if content is None:
+        return None
+    document = json.loads(content)
+    if name == 'calendar':
+        document['resources'] = {k: v for k, v in document['resources'].items() if k in DISCOVERY_RESOURCES}
+    document = _compact(document)
+    document['gcaltoolsClientVersion'] = client_version
+    try:
+        os.makedirs(DISCOVERY_DIR, exist_ok=True)
+        with open(cache_path, 'w') as cache_file:
+            json.dump(document, cache_file, separators=(',', ':'))
+    except OSError:
+        pass
+    return document
+
+
+class LocalCredentials:
+    """Dummy credentials for a local stand-in of the API (see api_root in init), no OAuth involved."""
+    invalid = False
+
+    def authorize(self, http):
+        request = http.request
+
+        def authorized_request(uri, method="GET", body=None, headers=None, *args, **kwargs):
+            headers = dict(headers) if headers is not None else {}
+            headers['authorization'] = 'Bearer local'
+            return request(uri, method, body, headers, *args, **kwargs)
+
+        http.request = authorized_request
+        return http
+
+
+def local_discovery_document(document, api_root):
+    """Returns copy of a discovery document sending requests to api_root instead of Google APIs."""
+    document = dict(document)
+    document['rootUrl'] = api_root
+    document['baseUrl'] = api_root + document['servicePath']
+    document.pop('mtlsRootUrl', None)
+    return document
+
+
+def authorized_http(credentials, cache=None):
+    """Returns new httplib2.Http object authorized with given credentials.
+
+  Args:
+    credentials: oauth2client.client.Credentials, shared by all HTTP objects.
+    cache: object, httplib2 compatible response cache (get/set/delete).
+  """
+    http = build_http()
+    http.cache = cache
+    return credentials.authorize(http=http)
 
 
 def init(
-    argv, name, version, doc, filename, scope=None, parents=[], discovery_filename=None
+    argv, name, version, doc, filename, scope=None, parents=[], discovery_filename=None, cache=None, model=None, api_root=None
 ):
     """A common initialization routine for samples.
 
@@ -28,10 +115,14 @@ def init(
     parents: list of argparse.ArgumentParser, additional command-line flags.
     scope: string, The OAuth scope used.
     discovery_filename: string, name of local discovery file (JSON). Use when discovery doc not available via URL.
+    cache: object, httplib2 compatible response cache (get/set/delete).
+    model: googleapiclient.model.Model, serializes requests and deserializes responses.
+    api_root: string, root URL of a local stand-in of the API, ie: http://127.0.0.1:8080/.
+      Requests are sent there with dummy credentials.
 
   Returns:
-    A tuple of (service, flags), where service is the service object and flags
-    is the parsed command-line flags.
+    A tuple of (service, flags, credentials), where service is the service object,
+    flags is the parsed command-line flags and credentials the OAuth 2.0 credentials.
   """
     try:
         from oauth2client import client
@@ -55,6 +146,18 @@ def init(
     )
     flags = parser.parse_args(argv[1:])
 
+    if api_root is not None:
+        credentials = LocalCredentials()
+        http = authorized_http(credentials, cache=cache)
+        with profiler.phase('discovery'):
+            if discovery_filename is None:
+                document = load_discovery_document(name, version)
+            else:
+                with open(discovery_filename) as discovery_file:
+                    document = json.load(discovery_file)
+            service = discovery.build_from_document(local_discovery_document(document, api_root), http=http, model=model)
+        return (service, flags, credentials)
+
     # Name of a file containing the OAuth 2.0 information for this
     # application, including client_id and client_secret, which are found
     # on the API Access tab on the Google APIs
@@ -73,19 +176,32 @@ def init(
     
     dat_file_path = os.path.join(os.path.expanduser('~'),".gcaltools/",name + ".dat")
 
-    storage = file.Storage(dat_file_path)
-    credentials = storage.get()
-    if credentials is None or credentials.invalid:
-        credentials = tools.run_flow(flow, storage, flags)
-    http = credentials.authorize(http=build_http())
+    with profiler.phase('auth'):
+        storage = file.Storage(dat_file_path)
+        credentials = storage.get()
+        if credentials is None or credentials.invalid:
+            credentials = tools.run_flow(flow, storage, flags)
+    http = authorized_http(credentials, cache=cache)
+
+    with profiler.phase('discovery'):
+        service = _build_service(name, version, http, model, discovery_filename)
+    return (service, flags, credentials)
+
 
+def _build_service(name, version, http, model, discovery_filename=None):
+    """Returns service object built from the cached, downloaded or given discovery document."""
     if discovery_filename is None:
-        # Construct a service object via the discovery service.
-        service = discovery.build(name, version, http=http)
+        document = load_discovery_document(name, version)
+        if document is not None:
+            # Construct a service object using the locally cached discovery document.
+            service = discovery.build_from_document(document, http=http, model=model)
+        else:
+            # Construct a service object via the discovery service.
+            service = discovery.build(name, version, http=http, model=model)
     else:
         # Construct a service object using a local discovery document file.
         with open(discovery_filename) as discovery_file:
             service = discovery.build_from_document(
-                discovery_file.read(), base="https://www.googleapis.com/", http=http
+                discovery_file.read(), base="https://www.googleapis.com/", http=http, model=model
             )
-    return (service, flags)
+    return service
@@ -4,10 +4,10 @@
 #
 #  Google calendar management tool
 #  author: dejongh.st@gmail.com
+import os
+import sys
+
 from gcaltools.cli_parser import cli_parser
-from gcaltools.gcal_api import GoogleCalendarManager
-from gcaltools.cli_command import CliCommand
-from gcaltools.prompter import Prompter
 
 
 def main():
@@ -15,17 +15,69 @@ def main():
     parser = cli_parser()
 
     args = parser.parse_args()
+
+    if args.profile or args.profile_json:
+        from gcaltools import profiler
+        profiler.enable(memory=args.profile_memory)
+        try:
+            run(parser, args)
+        finally:
+            report_profile(profiler.active().results(), args)
+    else:
+        run(parser, args)
+
+
+def report_profile(profile: dict, args) -> None:
+    if args.profile:
+        from gcaltools.printer import profile_printer
+        profile_printer(profile)
+    if args.profile_json:
+        import json
+        try:
+            with open(args.profile_json, 'w') as profile_file:
+                json.dump(profile, profile_file, indent=2)
+        except OSError:
+            print('ERROR: Unable to write profile to {}'.format(args.profile_json))
+
+
+def run(parser, args) -> None:
     remote_auth = (args.command == 'remoteauth')
 
+    # Profiled commands are run locally, the daemon does not profile its requests
+    if (args.use_daemon or os.environ.get('GCALTOOLS_USE_DAEMON') == '1') and not args.interactive and not (args.profile or args.profile_json):
+        # Client mode: the command runs in the resident daemon, nothing else is loaded here
+        from gcaltools.daemon import LOCAL_COMMANDS, run_client
+        if args.command not in LOCAL_COMMANDS:
+            status = run_client(sys.argv[1:], args.socket)
+            if status is not None:
+                sys.exit(status)
+            print('WARNING: gcaltools daemon is not running, command is run locally.')
+
+    from gcaltools import profiler
+    with profiler.phase('imports'):
+        from gcaltools.gcal_api import GoogleCalendarManager
+        from gcaltools.cli_command import CliCommand
+
+    traffic = None
+    if args.debug_bytes or args.command == 'daemon':
+        # The daemon counts traffic of every command, it is displayed for clients asking for it
+        from gcaltools.transport import TrafficStats
+        traffic = TrafficStats()
+
     # Create Google Calendar Manager
-    calendar_manager = GoogleCalendarManager(remote_auth=remote_auth)
+    calendar_manager = GoogleCalendarManager(remote_auth=remote_auth, traffic=traffic)
 
     # Create CLI Commands Manager
     cli_commands = CliCommand(calendar_manager)
 
     if args.interactive:
+        # prompt_toolkit is only loaded for interactive mode
+        from gcaltools.prompter import Prompter
         cli_prompt = Prompter(cli_commands)
         cli_prompt.run()
+    elif args.command == 'daemon':
+        from gcaltools.daemon import Daemon
+        Daemon(cli_commands, parser, args.socket).run()
     else:
         # Execute function for args.command
         cli_commands.execute_cmd(args.command, args)
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+
+from gcaltools.config import HTTP_CACHE_MAX_SIZE
+
+
+class ResponseCache:
+    """On-disk HTTP response cache, pluggable into httplib2.Http
+    Responses are stored by URL along with their ETag so httplib2 revalidates them with If-None-Match.
+    Least recently used entries are evicted once the cache grows over max_size bytes.
+    Its size is tracked in memory from the first write, the directory is only scanned again to evict.
+    """
+    cache_dir_path = os.path.join(os.path.expanduser('~'), '.gcaltools/http_cache')
+
+    # One-shot URLs never requested twice
+    uncached_parameters = ('syncToken=',)
+
+    def __init__(self, cache_dir_path: str = None, max_size: int = HTTP_CACHE_MAX_SIZE) -> None:
+        if cache_dir_path is not None:
+            self.cache_dir_path = cache_dir_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir_path, exist_ok=True)
+
+    def __entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir_path, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key: str) -> bytes or None:
+        path = self.__entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            # Access time drives LRU eviction, even on noatime mounts
+            os.utime(path)
+            self.hits += 1
+            return value
+        except OSError:
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        if any(parameter in key for parameter in self.uncached_parameters):
+            return
+        path = self.__entry_path(key)
+        temp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with self._lock:
+            if self._size is None:
+                self._size = sum(e[1] for e in self.__entries())
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(value)
+                replaced = self.__file_size(path)
+                os.replace(temp_path, path)
+            except OSError:
+                return
+            self._size += len(value) - replaced
+            if self._size > self.max_size:
+                self.__evict()
+
+    def delete(self, key: str) -> None:
+        path = self.__entry_path(key)
+        with self._lock:
+            size = self.__file_size(path)
+            try:
+                os.remove(path)
+            except OSError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    @staticmethod
+    def __file_size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def __entries(self):
+        """Returns list of (mtime, size, path) for all cached responses, least recently used first"""
+        entries = []
+        for entry in os.scandir(self.cache_dir_path):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def __evict(self) -> None:
+        # Other processes (ie: the daemon) share the directory: its actual size is read again
+        entries = self.__entries()
+        size = sum(e[1] for e in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
+
+    def stats(self) -> dict:
+        """Returns cache usage statistics"""
+        entries = self.__entries()
+        return {
+            'directory': self.cache_dir_path,
+            'entries': len(entries),
+            'size': sum(e[1] for e in entries),
+            'max_size': self.max_size,
+        }
+
+    def clear(self) -> None:
+        """Remove all cached responses"""
+        with self._lock:
+            for _, _, path in self.__entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
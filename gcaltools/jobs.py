@@ -0,0 +1,111 @@
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Job run by the current thread, if any
+_current = threading.local()
+
+
+def current_job():
+    return getattr(_current, 'job', None)
+
+
+def check_cancelled() -> None:
+    """Raise JobCancelled if the job run by the current thread was cancelled"""
+    job = current_job()
+    if job is not None and job.cancel_requested.is_set():
+        raise JobCancelled()
+
+
+def in_current_job(function):
+    """Returns function running as part of the caller's job, for use in worker threads"""
+    job = current_job()
+    if job is None:
+        return function
+
+    def run(*args, **kwargs):
+        _current.job = job
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.job = None
+
+    return run
+
+
+class Job:
+    """Command run in a background thread
+    Cancellation is cooperative: the job stops at its next API call or stored event read.
+    """
+
+    def __init__(self, job_id: int, description: str) -> None:
+        self.id = job_id
+        self.description = description
+        self.cancel_requested = threading.Event()
+        self.started = time.monotonic()
+        self.finished = None
+        self.status = 'running'
+        self.error = None
+        self.done = 0
+        self.total = None
+        self._lock = threading.Lock()
+
+    def advance(self, count: int = 1) -> None:
+        with self._lock:
+            self.done += count
+
+    def run(self, function, *args) -> None:
+        _current.job = self
+        try:
+            function(*args)
+            self.status = 'done'
+        except JobCancelled:
+            self.status = 'cancelled'
+        except SystemExit:
+            # Commands exit after printing their own error message
+            self.status = 'failed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = e
+        finally:
+            _current.job = None
+            self.finished = time.monotonic()
+
+    def elapsed(self) -> float:
+        return (self.finished if self.finished is not None else time.monotonic()) - self.started
+
+    def progress(self) -> str:
+        if self.total:
+            return '{}/{}'.format(self.done, self.total)
+        return str(self.done) if self.done else ''
+
+
+class JobManager:
+    """Background jobs of an interactive session"""
+
+    def __init__(self) -> None:
+        self.jobs = {}
+        self._next_id = 1
+
+    def start(self, loop, description: str, function, *args) -> Job:
+        """Runs function in the event loop default executor, returns its job"""
+        job = Job(self._next_id, description)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        job.future = loop.run_in_executor(None, job.run, function, *args)
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        """Ask a running job to stop, returns False if there is no such running job"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status != 'running':
+            return False
+        job.cancel_requested.set()
+        return True
+
+    def running(self) -> list:
+        return [job for job in self.jobs.values() if job.status == 'running']
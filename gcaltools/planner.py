@@ -0,0 +1,128 @@
+import argparse
+import csv
+import re
+from datetime import timedelta
+from os import path
+
+import yaml
+
+from gcaltools.cli_parser import valid_attendees, valid_date, valid_time
+from gcaltools.config import COLORS, PERIODS
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DEFAULT_WEEKDAYS = 'mon,tue,wed,thu,fri'
+PLAN_FIELDS = ['template', 'title', 'calendar', 'start_date', 'end_date', 'weekdays', 'period', 'duration', 'color', 'attendees']
+
+
+def load_plan(plan_file: str) -> list:
+    """Loads course schedule plan entries from a YAML (list of mappings) or CSV (one entry per row) file"""
+    with open(plan_file, newline='') as f:
+        if path.splitext(plan_file)[1].lower() == '.csv':
+            return [{k: v for k, v in row.items() if v not in (None, '')} for row in csv.DictReader(f)]
+        # Scalars are kept as strings, like CSV cells, and validated by expand_plan
+        entries = yaml.load(f, Loader=yaml.BaseLoader)
+        return entries if entries is not None else []
+
+
+def _split(value) -> list:
+    """Returns list from YAML list or string separated by commas, semicolons or spaces"""
+    if isinstance(value, list):
+        return [str(v).strip() for v in value]
+    return [v for v in re.split(r'[,; ]+', str(value).strip()) if v]
+
+
+def _weekday(day: str) -> int:
+    """Returns weekday number (monday is 0) of a short (mon) or full (monday) day name"""
+    name = day.lower()
+    if name in WEEKDAYS:
+        return WEEKDAYS.index(name)
+    if name in WEEKDAY_NAMES:
+        return WEEKDAY_NAMES.index(name)
+    raise ValueError('unknown weekday {}'.format(day))
+
+
+def _start_times(period) -> list:
+    period = str(period).strip().lower()
+    if period == 'full':
+        return [valid_time(p) for p in PERIODS]
+    return [valid_time(period)]
+
+
+def expand_plan(entries: list, templates: dict, calendar_manager) -> tuple:
+    """Expands plan entries into event bodies, validating every entry first
+    Returns (events, errors): events maps calendar name to list of event bodies, errors lists error messages.
+    """
+    events = {}
+    errors = []
+
+    for number, entry in enumerate(entries, start=1):
+        def error(message):
+            errors.append('entry {}: {}'.format(number, message))
+
+        if not isinstance(entry, dict):
+            error('not a mapping of plan fields')
+            continue
+
+        unknown_fields = [k for k in entry if k not in PLAN_FIELDS]
+        if unknown_fields:
+            error('unknown field(s) {}'.format(', '.join(unknown_fields)))
+            continue
+
+        settings = {'title': None, 'duration': calendar_manager.default_event_duration, 'color': None, 'attendees': None}
+        if 'template' in entry:
+            if entry['template'] not in templates:
+                error('template {} not found'.format(entry['template']))
+                continue
+            template = templates[entry['template']]
+            settings.update({k: template[k] for k in settings if template.get(k) not in (None, '')})
+
+        try:
+            calendar = entry.get('calendar', calendar_manager.default_calendar)
+            if calendar is None:
+                raise ValueError('no calendar given and default calendar not set')
+            if not calendar_manager.calendar_exists(calendar):
+                raise ValueError('calendar {} does not exist'.format(calendar))
+
+            start_date = valid_date(str(entry['start_date']))
+            end_date = valid_date(str(entry.get('end_date', entry['start_date'])))
+            if end_date < start_date:
+                raise ValueError('end_date is before start_date')
+
+            weekdays = {_weekday(day) for day in _split(entry.get('weekdays', DEFAULT_WEEKDAYS))}
+
+            start_times = _start_times(entry.get('period', 'full'))
+
+            if 'title' in entry:
+                settings['title'] = str(entry['title'])
+            if not settings['title']:
+                raise ValueError('no event title defined')
+
+            if 'duration' in entry:
+                settings['duration'] = entry['duration']
+            if not str(settings['duration']).strip().isdigit() or int(settings['duration']) <= 0:
+                raise ValueError('duration {} is not a positive number of minutes'.format(settings['duration']))
+            settings['duration'] = int(settings['duration'])
+
+            if 'color' in entry:
+                settings['color'] = str(entry['color'])
+            if settings['color'] is not None and settings['color'] not in COLORS:
+                raise ValueError('unknown color {}'.format(settings['color']))
+
+            if 'attendees' in entry:
+                settings['attendees'] = valid_attendees(','.join(_split(entry['attendees'])))
+        except KeyError as e:
+            error('missing field {}'.format(e))
+            continue
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            error(str(e).replace('\n', ' '))
+            continue
+
+        day = start_date
+        while day <= end_date:
+            if day.weekday() in weekdays:
+                for start_time in start_times:
+                    events.setdefault(calendar, []).append(calendar_manager.event_body(settings['title'], day, start_time, settings['duration'], settings['attendees'], settings['color']))
+            day += timedelta(days=1)
+
+    return events, errors
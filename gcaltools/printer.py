@@ -2,8 +2,10 @@ from rich.table import Table
 from rich.console import Console
 from rich import box
 from datetime import datetime
+from gcaltools.profiler import timed
 
 
+@timed('render')
 def calendar_list_printer(calendar_list):
 
     calendars_table = Table(title="Available calendars", box=box.SQUARE)
@@ -19,6 +21,7 @@ def calendar_list_printer(calendar_list):
     console.print()
 
 
+@timed('render')
 def events_printer(event_list):
 
     events_table = Table(title="Courses", box=box.SQUARE)
@@ -28,19 +31,19 @@ def events_printer(event_list):
     events_table.add_column("Attendees", justify="right", style="green")
 
     for e in event_list:
-        if 'date' in e['start'].keys():
-            start_date = datetime.fromisoformat(e['start']['date']).strftime('%a %d %b %Y (all day)')
-            end_date = datetime.fromisoformat(e['end']['date']).strftime('%a %d %b %Y (all day)')
+        if e.all_day:
+            start_date = e.start.strftime('%a %d %b %Y (all day)')
+            end_date = e.end.strftime('%a %d %b %Y (all day)')
         else:
-            start_date = datetime.fromisoformat(e['start']['dateTime']).strftime('%a %d %b %Y --- %H:%M')
-            end_date = datetime.fromisoformat(e['end']['dateTime']).strftime('%a %d %b %Y --- %H:%M')
+            start_date = e.start.strftime('%a %d %b %Y --- %H:%M')
+            end_date = e.end.strftime('%a %d %b %Y --- %H:%M')
 
-        if "attendees" in e.keys():
-            attendees_string = ", ".join([att['email'] for att in e['attendees']])
+        if e.attendees:
+            attendees_string = ", ".join(e.attendee_emails)
         else:
             attendees_string = "n/a"
 
-        events_table.add_row(start_date, end_date, e['summary'], attendees_string)
+        events_table.add_row(start_date, end_date, e.summary, attendees_string)
 
     console = Console()
     console.print()
@@ -48,6 +51,7 @@ def events_printer(event_list):
     console.print()
 
 
+@timed('render')
 def default_printer(user_preferences):
 
     defaults_table = Table(title="User preferences", box=box.SQUARE)
@@ -63,9 +67,12 @@ def default_printer(user_preferences):
     console.print()
 
 
-def summary_printer(calendar_name, calendar_summary, start_date, end_date):
+@timed('render')
+def summary_printer(calendar_name, calendar_summary, start_date, end_date, bucket=None):
 
-    if start_date is not None and end_date is not None:
+    if bucket is not None:
+        timing = bucket
+    elif start_date is not None and end_date is not None:
         timing = "{} -> {}".format(start_date.strftime("%Y/%m/%d"), end_date.strftime("%Y/%m/%d"))
     else:
         timing = "Full training session"
@@ -82,6 +89,48 @@ def summary_printer(calendar_name, calendar_summary, start_date, end_date):
     console.print()
 
 
+@timed('render')
+def conflicts_printer(conflicts, start_date, end_date):
+
+    conflicts_table = Table(title="Attendees conflicts ({} -> {})".format(start_date.strftime("%Y/%m/%d"), end_date.strftime("%Y/%m/%d")), box=box.SQUARE)
+    conflicts_table.add_column("Attendee", justify="left", style="magenta")
+    conflicts_table.add_column("Start Date", justify="center", style="cyan")
+    conflicts_table.add_column("First event", justify="left", style="green")
+    conflicts_table.add_column("Second event", justify="left", style="green")
+
+    for email, (first_calendar, first), (second_calendar, second) in conflicts:
+        start = max(first.start, second.start)
+        conflicts_table.add_row(email, start.strftime('%a %d %b %Y --- %H:%M'), "{} ({})".format(first.summary, first_calendar), "{} ({})".format(second.summary, second_calendar))
+
+    console = Console()
+    console.print()
+    if conflicts_table.row_count:
+        console.print(conflicts_table)
+    else:
+        console.print("No attendee is booked twice.")
+    console.print()
+
+
+@timed('render')
+def slots_printer(slots, attendees):
+
+    slots_table = Table(title="Free slots for {}".format(", ".join(attendees)), box=box.SQUARE)
+    slots_table.add_column("Start Date", justify="center", style="cyan")
+    slots_table.add_column("End Date", justify="center", style="cyan")
+
+    for start, end in slots:
+        slots_table.add_row(start.strftime('%a %d %b %Y --- %H:%M'), end.strftime('%a %d %b %Y --- %H:%M'))
+
+    console = Console()
+    console.print()
+    if slots_table.row_count:
+        console.print(slots_table)
+    else:
+        console.print("No free slot found.")
+    console.print()
+
+
+@timed('render')
 def templates_printer(templates):
     templates_table = Table(title="Available courses templates", box=box.SQUARE)
     templates_table.add_column("Template", justify="left", style="magenta")
@@ -98,3 +147,75 @@ def templates_printer(templates):
     console.print()
     console.print(templates_table)
     console.print()
+
+
+@timed('render')
+def cache_stats_printer(cache_stats):
+    cache_table = Table(title="HTTP response cache", box=box.SQUARE)
+    cache_table.add_column("Information", justify="left", style="magenta")
+    cache_table.add_column("Value", justify="right", style="green")
+
+    cache_table.add_row("Directory", cache_stats['directory'])
+    cache_table.add_row("Cached responses", str(cache_stats['entries']))
+    cache_table.add_row("Size (KiB)", "{:.1f}".format(cache_stats['size'] / 1024))
+    cache_table.add_row("Size limit (KiB)", "{:.1f}".format(cache_stats['max_size'] / 1024))
+
+    console = Console()
+    console.print()
+    console.print(cache_table)
+    console.print()
+
+
+@timed('render')
+def jobs_printer(jobs):
+    jobs_table = Table(title="Background jobs", box=box.SQUARE)
+    jobs_table.add_column("Job", justify="right", style="magenta")
+    jobs_table.add_column("Command", justify="left", style="green")
+    jobs_table.add_column("Status", justify="left", style="cyan")
+    jobs_table.add_column("Progress", justify="right", style="cyan")
+    jobs_table.add_column("Elapsed (s)", justify="right", style="cyan")
+
+    for job in jobs:
+        status = job.status if job.error is None else '{}: {}'.format(job.status, job.error)
+        jobs_table.add_row(str(job.id), job.description, status, job.progress(), "{:.1f}".format(job.elapsed()))
+
+    console = Console()
+    console.print()
+    if jobs_table.row_count:
+        console.print(jobs_table)
+    else:
+        console.print("No background job.")
+    console.print()
+
+
+def profile_printer(profile):
+    phases_table = Table(title="Profile: {:.3f}s".format(profile['wall_seconds']), box=box.SQUARE)
+    phases_table.add_column("Phase", justify="left", style="magenta")
+    phases_table.add_column("Calls", justify="right", style="green")
+    phases_table.add_column("Time (s)", justify="right", style="green")
+    for name, phase in sorted(profile['phases'].items(), key=lambda p: -p[1]['seconds']):
+        phases_table.add_row(name, str(phase['calls']), "{:.3f}".format(phase['seconds']))
+
+    # Every method belongs to the Calendar API: its prefix is dropped, names are never shortened
+    methods = {name.replace('calendar.', ''): method for name, method in profile['api'].items()}
+    api_table = Table(title="API requests", box=box.SQUARE)
+    api_table.add_column("Method", justify="left", style="magenta", no_wrap=True, min_width=max(map(len, methods), default=0))
+    for column in ("Calls", "Cached", "Retries", "Out (KiB)", "In (KiB)", "Time (s)"):
+        api_table.add_column(column, justify="right", style="green")
+    for name, method in sorted(methods.items()):
+        api_table.add_row(name, str(method['requests']), str(method['cached']), str(method['retries']),
+                          "{:.1f}".format(method['bytes_out'] / 1024), "{:.1f}".format(method['bytes_in'] / 1024), "{:.3f}".format(method['seconds']))
+
+    console = Console()
+    console.print()
+    console.print(phases_table)
+    if api_table.row_count:
+        console.print(api_table)
+    if 'memory' in profile:
+        console.print("Peak traced memory: {:.1f} MiB".format(profile['memory']['peak_bytes'] / 1024 / 1024))
+    console.print()
+
+
+def import_progress():
+    from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn
+    return Progress(TextColumn("[magenta]{task.description}"), BarColumn(), MofNCompleteColumn(), TimeElapsedColumn())
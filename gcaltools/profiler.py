@@ -0,0 +1,180 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Profiler collecting timings of the current run, None when profiling is disabled:
+# hooks below then return at once, without timing anything
+_profiler = None
+
+_NO_PHASE = nullcontext()
+
+
+class Profiler:
+    """Wall time per phase and requests, bytes, cache hits, retries and time per API method
+    Phases are inclusive (a report phase contains the event reads it triggers) and summed over threads.
+    Peak memory is only traced with memory=True, tracemalloc slows everything down.
+    """
+
+    def __init__(self, memory: bool = False) -> None:
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.methods = {}
+        self.memory = memory
+        self._lock = threading.Lock()
+        # API method of the request sent by each thread
+        self._local = threading.local()
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            phase = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            phase['calls'] += 1
+            phase['seconds'] += seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def __method(self, name: str) -> dict:
+        # Called with _lock held
+        return self.methods.setdefault(name, {'requests': 0, 'cached': 0, 'retries': 0, 'bytes_out': 0, 'bytes_in': 0, 'seconds': 0.0})
+
+    @contextmanager
+    def request(self, method: str):
+        """Times an API request, HTTP traffic of the current thread meanwhile is recorded for method"""
+        self._local.method = method
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.method = None
+            with self._lock:
+                stats = self.__method(method)
+                stats['requests'] += 1
+                stats['seconds'] += time.perf_counter() - start
+
+    def record_response(self, body, response, content) -> None:
+        method = getattr(self._local, 'method', None) or 'other'
+        with self._lock:
+            stats = self.__method(method)
+            stats['bytes_out'] += len(body) if body else 0
+            stats['bytes_in'] += len(content) if content else 0
+            stats['cached'] += bool(response.fromcache)
+
+    def record_retry(self, method: str, count: int = 1) -> None:
+        with self._lock:
+            self.__method(method)['retries'] += count
+
+    def wrap(self, http):
+        """Wraps http.request to record each response"""
+        request = http.request
+
+        def recorded_request(uri, method="GET", body=None, *args, **kwargs):
+            response, content = request(uri, method, body, *args, **kwargs)
+            self.record_response(body, response, content)
+            return response, content
+
+        http.request = recorded_request
+        return http
+
+    def results(self) -> dict:
+        results = {
+            'wall_seconds': time.perf_counter() - self.started,
+            'phases': self.phases,
+            'api': self.methods,
+        }
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            results['memory'] = {'current_bytes': current, 'peak_bytes': peak}
+        return results
+
+
+def enable(memory: bool = False) -> Profiler:
+    global _profiler
+    _profiler = Profiler(memory)
+    return _profiler
+
+
+def active() -> Profiler or None:
+    return _profiler
+
+
+def phase(name: str):
+    """Context manager timing a phase"""
+    if _profiler is None:
+        return _NO_PHASE
+    return _profiler.phase(name)
+
+
+def timed(name: str):
+    """Decorator timing each call of a function as a phase"""
+    def decorator(function):
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.phase(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
+
+
+def timed_iter(name: str, iterable):
+    """Returns iterable, timing the production of its items as a phase when profiling"""
+    if _profiler is None:
+        return iterable
+    return _timed_iter(_profiler, name, iterable)
+
+
+def _timed_iter(profiler: Profiler, name: str, iterable):
+    iterator = iter(iterable)
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - start
+            yield item
+    finally:
+        profiler.add_phase(name, seconds)
+
+
+def method_name(api_request) -> str:
+    """API method of a request (batch:method for batches)"""
+    method = getattr(api_request, 'methodId', None) or 'other'
+    if hasattr(api_request, '_requests'):
+        # Batch requests carry their sub-requests, all of the same method in gcaltools
+        requests = list(api_request._requests.values())
+        method = 'batch:{}'.format(getattr(requests[0], 'methodId', '?') if requests else '?')
+    return method
+
+
+def request(api_request):
+    """Context manager timing an API request, named after its method"""
+    if _profiler is None:
+        return _NO_PHASE
+    return _profiler.request(method_name(api_request))
+
+
+def record_retry(method: str, count: int = 1) -> None:
+    if _profiler is not None:
+        _profiler.record_retry(method, count)
+
+
+def wrap_http(http):
+    """Records traffic of http when profiling"""
+    if _profiler is None:
+        return http
+    return _profiler.wrap(http)
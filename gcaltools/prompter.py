@@ -1,11 +1,13 @@
 import sys
+import asyncio
 import argparse
 
-from gcaltools.config import AVAILABLE_COMMANDS
-from gcaltools.cli_parser import sub_parser_template, sub_parser_show, sub_parser_report, sub_parser_summary, sub_parser_default, sub_parser_add, sub_parser_list
+from gcaltools.config import AVAILABLE_COMMANDS, BACKGROUND_COMMANDS, PREFETCH_INTERVAL
+from gcaltools.cli_parser import sub_parser_cache, sub_parser_import, sub_parser_conflicts, sub_parser_find_slot, sub_parser_search, sub_parser_template, sub_parser_show, sub_parser_report, sub_parser_summary, sub_parser_default, sub_parser_add, sub_parser_list
+from gcaltools.jobs import JobManager
 from prompt_toolkit import PromptSession
-from prompt_toolkit.completion import WordCompleter
-from prompt_toolkit.completion.nested import NestedCompleter
+from prompt_toolkit.completion import Completer, Completion
+from prompt_toolkit.patch_stdout import patch_stdout
 
 
 def get_commandline(text: str):
@@ -45,14 +47,74 @@ class NestedParser(argparse.ArgumentParser):
         return formatter.format_help()
 
 
+def _sub_parsers(parser) -> dict:
+    """Returns sub commands parsers of parser by name, empty if it has none"""
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            return action.choices
+    return {}
+
+
+class CommandCompleter(Completer):
+    """Completes commands, options and option values following the prompter parser
+    Calendar names, templates and attendees come from the session state: no API call and files
+    are only parsed again when they change.
+    """
+
+    def __init__(self, parser, cli_commands) -> None:
+        self.__parser = parser
+        self.__cli_commands = cli_commands
+
+    def __values(self, action) -> list:
+        if action.choices:
+            return [str(choice) for choice in action.choices]
+        if action.dest == 'calendar':
+            return [cal['summary'] for cal in self.__cli_commands.calendar_manager.get_calendars()]
+        if action.dest == 'template':
+            return self.__cli_commands.template_names()
+        if action.dest in ('attendees', 'attendee'):
+            return self.__cli_commands.known_attendees()
+        return []
+
+    def get_completions(self, document, complete_event):
+        words = document.text_before_cursor.split()
+        current = '' if not words or document.text_before_cursor[-1].isspace() else words.pop()
+
+        parser = self.__parser
+        for word in words:
+            parser = _sub_parsers(parser).get(word, parser)
+
+        previous_action = parser._option_string_actions.get(words[-1]) if words else None
+        if previous_action is not None and previous_action.nargs != 0:
+            # Attendees lists are separated by commas, only the last one is completed
+            current = current.rpartition(',')[2] if previous_action.dest == 'attendees' else current
+            candidates = self.__values(previous_action)
+        elif current.startswith('-'):
+            candidates = sorted(parser._option_string_actions)
+        else:
+            candidates = sorted(_sub_parsers(parser))
+
+        for candidate in candidates:
+            if candidate.startswith(current.strip('"')):
+                text = '"{}"'.format(candidate) if ' ' in candidate else candidate
+                yield Completion(text, start_position=-len(current))
+
+
 class Prompter:
+    """Interactive prompt running on prompt_toolkit's asyncio loop
+    The default calendar current week and month are prefetched while the user types, long commands
+    (BACKGROUND_COMMANDS, or any command ending with &) run as background jobs.
+    """
+
     def __init__(self, cli_commands):
         self.__commands = AVAILABLE_COMMANDS
-        self.__completer = NestedCompleter(options={cmd: WordCompleter([]) for cmd in self.__commands})
         self.__parser = NestedParser(add_help=False)
         sub_parser = self.__parser.add_subparsers(dest="command")
         sub_parser.add_parser("quit", help="Exits gcaltools interactive prompt")
         sub_parser.add_parser("help", help="Display available commands")
+        sub_parser.add_parser("jobs", help="Display background jobs")
+        cancel_parser = sub_parser.add_parser("cancel", help="Cancel a background job")
+        cancel_parser.add_argument("job", type=int, help="Job number, see jobs command")
         sub_parser_list(sub_parser, add_help=False)
         sub_parser_add(sub_parser, add_help=False)
         sub_parser_default(sub_parser, add_help=False)
@@ -60,31 +122,81 @@ class Prompter:
         sub_parser_report(sub_parser, add_help=False)
         sub_parser_summary(sub_parser, add_help=False)
         sub_parser_template(sub_parser, add_help=False)
+        sub_parser_cache(sub_parser, add_help=False)
+        sub_parser_import(sub_parser, add_help=False)
+        sub_parser_conflicts(sub_parser, add_help=False)
+        sub_parser_find_slot(sub_parser, add_help=False)
+        sub_parser_search(sub_parser, add_help=False)
+        self.__completer = CommandCompleter(self.__parser, cli_commands)
         self.__session = PromptSession(completer=self.__completer)
         self.__cli_commands = cli_commands
+        self.__jobs = JobManager()
+        self.__prefetching = None
 
     def run(self):
+        asyncio.run(self.__run())
+
+    def __prefetch(self, loop) -> None:
+        """Starts a background prefetch unless one is running or prefetched events are recent"""
+        if self.__prefetching is not None and not self.__prefetching.done():
+            return
+        age = self.__cli_commands.prefetch_age()
+        if age is not None and age < PREFETCH_INTERVAL:
+            return
+        self.__prefetching = loop.run_in_executor(None, self.__cli_commands.prefetch)
+
+    def __start_job(self, loop, text: str, args) -> None:
+        job = self.__jobs.start(loop, text, self.__cli_commands.execute_cmd, args.command, args)
+        print("[{}] {}".format(job.id, job.description))
+        job.future.add_done_callback(lambda future: print("[{}] {} ({}, {:.1f}s)".format(job.id, job.description, job.status, job.elapsed())))
+
+    def __quit(self) -> None:
+        # Running jobs stop at their next API call, the loop waits for them before exiting
+        for job in self.__jobs.running():
+            self.__jobs.cancel(job.id)
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
         self.__session.output.write("\nWelcome to GCALTOOLS!\n\n")
-        while True:
-            try:
-                text = self.__session.prompt("gcaltools> ")
-            except KeyboardInterrupt:
-                continue
-            except EOFError:
-                break
-
-            if not len(text):
-                continue
-
-            try:
-                args = self.__parser.parse_args(get_commandline(text))
-            except argparse.ArgumentError:
-                continue
-
-            if args.command == "quit":
-                sys.exit(0)
-            elif args.command == "help":
-                print(self.__parser.format_help())
+        # Calendar list is loaded once for the whole session
+        self.__cli_commands.calendar_manager.calendars
+        # Output of background jobs and prefetch is printed above the prompt
+        with patch_stdout(raw=True):
+            while True:
+                self.__prefetch(loop)
+                try:
+                    text = await self.__session.prompt_async("gcaltools> ")
+                except KeyboardInterrupt:
+                    continue
+                except EOFError:
+                    self.__quit()
+                    break
 
-            else:
-                self.__cli_commands.execute_cmd(args.command, args)
+                text = text.strip()
+                background = text.endswith('&')
+                if background:
+                    text = text[:-1].rstrip()
+
+                if not len(text):
+                    continue
+
+                try:
+                    args = self.__parser.parse_args(get_commandline(text))
+                except argparse.ArgumentError:
+                    continue
+
+                if args.command == "quit":
+                    self.__quit()
+                    sys.exit(0)
+                elif args.command == "help":
+                    print(self.__parser.format_help())
+                elif args.command == "jobs":
+                    from gcaltools.printer import jobs_printer
+                    jobs_printer(self.__jobs.jobs.values())
+                elif args.command == "cancel":
+                    if not self.__jobs.cancel(args.job):
+                        print("ERROR: no running job {}".format(args.job))
+                elif background or args.command in BACKGROUND_COMMANDS:
+                    self.__start_job(loop, text, args)
+                else:
+                    self.__cli_commands.execute_cmd(args.command, args)
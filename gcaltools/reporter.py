@@ -1,105 +1,317 @@
+import csv
 import os
-import xlsxwriter
-import yaml
+import re
 import calendar
-from datetime import datetime, timedelta
-from xlsxwriter.utility import xl_rowcol_to_cell
+from datetime import date, datetime
+from functools import partial
+from gcaltools import profiler
+from gcaltools.aggregation import aggregate_hours
+from gcaltools.config import XLSX_MAX_SHEETS
+from gcaltools.utils import YamlFile
+
+
+# Attendees catalogs already parsed, by file path
+_attendees_catalogs = {}
 
 
 def load_attendees(attendees_catalog):
-    if os.path.exists(attendees_catalog):
-        with open(attendees_catalog) as file:
-            return yaml.load(file, Loader=yaml.FullLoader)
+    """Returns attendees catalog mapping emails to display names, parsed again only when the file changes"""
+    if attendees_catalog not in _attendees_catalogs:
+        _attendees_catalogs[attendees_catalog] = YamlFile(attendees_catalog)
+    return _attendees_catalogs[attendees_catalog].load({})
+
+
+def report_hours(event_list, year=None, month=None, start_date=None, end_date=None, time_zone='UTC'):
+    """Returns (hours, attendee_ids): hours per day and attendee, attendee columns sorted by email"""
+    if start_date is None and end_date is None:
+        # Report for dates on month/year basis
+        first_day = date(year, month, 1)
+        last_day = date(year, month, calendar.monthrange(year, month)[1])
     else:
-        return {}
-
-
-def parse_events(events_list):
-    events = {}
-    attendees_list = []
-
-    for event in events_list:
-        event_attendees = []
-        if 'attendees' in event.keys():
-            for attendee in event['attendees']:
-                event_attendees.append(attendee['email'])
-                if attendee['email'] not in attendees_list:
-                    attendees_list.append(attendee['email'])
-        start = datetime.fromisoformat(event['start']['dateTime'])
-        end = datetime.fromisoformat(event['end']['dateTime'])
-        event_day = start.strftime("%Y/%m/%d")
-        event_duration = (end - start).seconds / 3600
-
-        if event_day not in events.keys():
-            events[event_day] = {a: event_duration if a in event_attendees else 0 for a in attendees_list}
-        else:
-            for a in event_attendees:
-                if a in events[event_day]:
-                    events[event_day][a] = events[event_day][a] + event_duration
-                else:
-                    events[event_day][a] = event_duration
+        # Report for dates from start_date to end_date
+        first_day = start_date.date()
+        last_day = end_date.date()
 
-    return events, sorted(attendees_list)
+    hours = aggregate_hours(event_list, first_day, last_day, time_zone)
+    return hours, hours.sorted_attendee_ids()
 
 
-def xlsx_report(event_list, filename, year=None, month=None, start_date=None, end_date=None, attendees_catalog=None):
+def report_header(hours, attendee_ids, attendees_dict):
+    return ['Date'] + [attendees_dict.get(hours.attendees[a], hours.attendees[a]) for a in attendee_ids] + ['Total']
 
-    if attendees_catalog is not None:
-        attendees_dict = load_attendees(attendees_catalog)
-    else:
-        attendees_dict = {}
 
-    events, attendees = parse_events(event_list)
+def iter_report_rows(hours, attendee_ids, first_index=0, last_index=None):
+    """Yield one row of attendees hours per day, rows are only built when consumed"""
+    if last_index is None:
+        last_index = hours.days_count
+    for day_index in range(first_index, last_index):
+        yield [hours.day(day_index).strftime("%Y/%m/%d")] + hours.row(day_index, attendee_ids)
 
-    # HEADER ROW
-    rows = [['Date'] + [attendees_dict[a] if a in attendees_dict.keys() else a for a in attendees] + ['Total']]
 
-    # GENERATE ROWS
-    if start_date is None and end_date is None:
-        # Report for dates on month/year basis
-        print('Generating report for {}: {}'.format(str(year) + '/' + str(month), filename))
-        for day in range(calendar.monthrange(year, month)[1]):
-            row_date = datetime(year=year, month=month, day=day+1).strftime("%Y/%m/%d")
-            row = [row_date]
-            if row_date in events.keys():
-                row += [events[row_date][a] if a in events[row_date].keys() else 0 for a in attendees]
-            else:
-                row += [0] * len(attendees)
-            rows.append(row)
-    else:
-        # Report for dates from start_date to end_date
-        print('Generating report from {} to {}'.format(start_date, end_date))
-        actual_date = start_date
-        while actual_date <= end_date:
-            row_date = actual_date.strftime("%Y/%m/%d")
-            row = [row_date]
-            if row_date in events.keys():
-                row += [events[row_date][a] if a in events[row_date].keys() else 0 for a in attendees]
-            else:
-                row += [0] * len(attendees)
-            rows.append(row)
-            actual_date += timedelta(days=1)
+def month_ranges(hours):
+    """Yield (year, month, first_index, last_index) of each calendar month covered by hours"""
+    first_index = 0
+    while first_index < hours.days_count:
+        day = hours.day(first_index)
+        last_index = min(hours.days_count, first_index + calendar.monthrange(day.year, day.month)[1] - day.day + 1)
+        yield day.year, day.month, first_index, last_index
+        first_index = last_index
+
 
-    # WRITE FILE
-    book = xlsxwriter.Workbook(filename)
-    sheet = book.add_worksheet('Rapport')
+def write_sheet(book, sheet_name, header, rows):
+    """Streams header and rows into a new worksheet, appending a total formula to each row
+    Returns number of rows written after the header.
+    """
+    from xlsxwriter.utility import xl_rowcol_to_cell
+    sheet = book.add_worksheet(sheet_name)
+    sheet.write_row(0, 0, header)
+    attendees_count = len(header) - 2
 
     row_id = 0
-    for row in rows:
+    for row_id, row in enumerate(rows, start=1):
         first_cell = xl_rowcol_to_cell(row_id, 1)
-        if row_id > 0:
-            if len(attendees) > 1:
-                last_cell = xl_rowcol_to_cell(row_id, len(attendees))
-                row += ['=SUM({}:{})'.format(first_cell, last_cell)]
+        if attendees_count > 1:
+            last_cell = xl_rowcol_to_cell(row_id, attendees_count)
+            row.append('=SUM({}:{})'.format(first_cell, last_cell))
+        elif attendees_count == 1:
+            row.append('=SUM({})'.format(first_cell))
+        else:
+            row.append(0)
+        sheet.write_row(row_id, 0, row)
+    return row_id
+
+
+def sheets_count(hours) -> int:
+    """Returns number of worksheets write_hours adds for hours"""
+    months = list(month_ranges(hours))
+    if len(months) <= 1:
+        return 1
+    return len(months) + len({year for year, _, _, _ in months})
+
+
+def write_hours(book, hours, attendee_ids, attendees_dict, used_names, name_prefix='', single_sheet_name='Rapport'):
+    """Writes one worksheet for a single month, else one worksheet per month and a totals worksheet per year"""
+    from xlsxwriter.utility import xl_rowcol_to_cell
+    header = report_header(hours, attendee_ids, attendees_dict)
+    months = list(month_ranges(hours))
+
+    if len(months) == 1:
+        write_sheet(book, valid_sheet_name(single_sheet_name, used_names), header, iter_report_rows(hours, attendee_ids))
+        return
+
+    totals = None
+    totals_year = None
+    totals_row = 0
+    for year, month, first_index, last_index in months:
+        if year != totals_year:
+            totals_year = year
+            totals = book.add_worksheet(valid_sheet_name(name_prefix, used_names, suffix='{} Total'.format(year)))
+            totals.write_row(0, 0, ['Month'] + header[1:])
+            totals_row = 0
+
+        month_name = '{}-{:02d}'.format(year, month)
+        sheet_name = valid_sheet_name(name_prefix, used_names, suffix=month_name)
+        rows_count = write_sheet(book, sheet_name, header, iter_report_rows(hours, attendee_ids, first_index, last_index))
+
+        # Yearly totals refer to the month worksheets, one row per month
+        totals_row += 1
+        sheet_reference = "'{}'".format(sheet_name.replace("'", "''"))
+        totals.write_row(totals_row, 0, [month_name] + ['=SUM({}!{}:{})'.format(sheet_reference, xl_rowcol_to_cell(1, column), xl_rowcol_to_cell(rows_count, column)) for column in range(1, len(header))])
+
+
+def valid_sheet_name(name, used_names, suffix=''):
+    """Returns valid and unique worksheet name (max 31 chars, no []:*?/\\), name is truncated to keep suffix"""
+    base_name = re.sub(r'[\[\]:*?/\\]', '_', name)
+    candidate = base_name[:31 - len(suffix)] + suffix
+    counter = 1
+    while candidate.lower() in used_names:
+        counter += 1
+        unique_suffix = ' ({}){}'.format(counter, suffix)
+        candidate = base_name[:31 - len(unique_suffix)] + unique_suffix
+    used_names.add(candidate.lower())
+    return candidate
+
+
+def report_period(year=None, month=None, start_date=None, end_date=None):
+    if start_date is None and end_date is None:
+        return 'for {}'.format(str(year) + '/' + str(month))
+    return 'from {} to {}'.format(start_date, end_date)
+
+
+class ReportWriter:
+    """Writes attendees hours of one or several calendars to a report file
+    reports:    list of (calendar_name, aggregate) tuples, aggregate() returns (hours, attendee_ids)
+                calendars are aggregated one at a time, when the writer reaches them
+    """
+    extension = None
+    supports_append = False
+
+    def output_name(self, filename: str, append: bool = False) -> str:
+        return filename + self.extension
+
+    def write(self, filename: str, reports: list, attendees_dict: dict, append: bool = False) -> str:
+        """Writes report, returns name of the written file"""
+        raise NotImplementedError
+
+
+def iter_report_records(calendar_name, hours, attendee_ids, attendees_dict):
+    """Yield (calendar, date, email, name, hours) for each day and attendee with hours"""
+    for day_index in range(hours.days_count):
+        day = hours.day(day_index)
+        for attendee_id, attendee_hours in zip(attendee_ids, hours.row(day_index, attendee_ids)):
+            if attendee_hours:
+                email = hours.attendees[attendee_id]
+                yield calendar_name, day, email, attendees_dict.get(email, email), attendee_hours
+
+
+class XlsxReportWriter(ReportWriter):
+    """One worksheet per calendar and month, yearly totals for reports longer than a month
+    Calendars which would take a workbook over max_sheets worksheets continue in the next file
+    (report-2.xlsx, ...), a calendar is never split over two files.
+    """
+    extension = '.xlsx'
+
+    def __init__(self, max_sheets: int = XLSX_MAX_SHEETS) -> None:
+        self.max_sheets = max_sheets
+
+    def write(self, filename, reports, attendees_dict, append=False):
+        import xlsxwriter
+        first_filename = filename + self.extension
+        book = None
+        part = 0
+        for calendar_name, aggregate in reports:
+            hours, attendee_ids = aggregate()
+            needed = sheets_count(hours)
+            if book is not None and len(book.worksheets()) + needed > self.max_sheets:
+                # Closing the workbook releases the temporary files of its worksheets
+                book.close()
+                book = None
+            if book is None:
+                part += 1
+                part_filename = first_filename if part == 1 else '{}-{}{}'.format(filename, part, self.extension)
+                if part > 1:
+                    print('Report continued in {}'.format(part_filename))
+                # Rows are flushed to disk as they are written
+                book = xlsxwriter.Workbook(part_filename, {'constant_memory': True})
+                used_names = set()
+            if len(reports) == 1:
+                write_hours(book, hours, attendee_ids, attendees_dict, used_names)
             else:
-                row += ['=SUM({})'.format(first_cell)]
-        sheet.write_row(row_id, 0, rows[row_id])
-        row_id += 1
+                write_hours(book, hours, attendee_ids, attendees_dict, used_names, name_prefix=calendar_name + ' ', single_sheet_name=calendar_name)
+        if book is not None:
+            book.close()
+        return first_filename
 
-    book.close()
-    print('Report generation complete.')
 
+class CsvReportWriter(ReportWriter):
+    """One line per calendar, day and attendee with hours, appending keeps previous lines"""
+    extension = '.csv'
+    supports_append = True
+    header = ['calendar', 'date', 'attendee_email', 'attendee_name', 'hours']
+
+    def write(self, filename, reports, attendees_dict, append=False):
+        filename += self.extension
+        write_header = not (append and os.path.exists(filename) and os.path.getsize(filename) > 0)
+        with open(filename, 'a' if append else 'w', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(self.header)
+            for calendar_name, aggregate in reports:
+                hours, attendee_ids = aggregate()
+                for record in iter_report_records(calendar_name, hours, attendee_ids, attendees_dict):
+                    writer.writerow((record[0], record[1].isoformat()) + record[2:])
+        return filename
+
+
+class MarkdownReportWriter(ReportWriter):
+    """One table per calendar, same layout as the XLSX report"""
+    extension = '.md'
+
+    def write(self, filename, reports, attendees_dict, append=False):
+        filename += self.extension
+        with open(filename, 'w') as f:
+            for calendar_name, aggregate in reports:
+                hours, attendee_ids = aggregate()
+                header = report_header(hours, attendee_ids, attendees_dict)
+                f.write('## {}\n\n'.format(calendar_name))
+                f.write('| {} |\n'.format(' | '.join(header)))
+                f.write('|{}\n'.format(' :--- |' + ' ---: |' * (len(header) - 1)))
+                for row in iter_report_rows(hours, attendee_ids):
+                    f.write('| {} | {:g} |\n'.format(' | '.join([row[0]] + ['{:g}'.format(h) for h in row[1:]]), sum(row[1:])))
+                f.write('\n')
+        return filename
+
+
+class ParquetReportWriter(ReportWriter):
+    """Columnar report, same records as the CSV report
+    Appending writes one more file of the dataset directory instead of rewriting previous ones.
+    """
+    extension = '.parquet'
+    supports_append = True
+
+    # Records buffered before writing a row group
+    row_group_size = 65536
 
-# TO DO
-# def md_report(event_list, filename, year, month, attendees_catalog=None):
-#    pass
+    def output_name(self, filename, append=False):
+        return filename if append else filename + self.extension
+
+    def write(self, filename, reports, attendees_dict, append=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print("ERROR: Parquet reports require pyarrow. Please install the parquet extra (pip install 'gcaltools[parquet]') and try again.")
+            exit()
+
+        schema = pyarrow.schema([('calendar', pyarrow.string()), ('date', pyarrow.date32()), ('attendee_email', pyarrow.string()), ('attendee_name', pyarrow.string()), ('hours', pyarrow.float64())])
+        if append:
+            # Dataset directory, one file per run
+            os.makedirs(filename, exist_ok=True)
+            filename = os.path.join(filename, '{}{}'.format(datetime.now().strftime('%Y%m%d%H%M%S%f'), self.extension))
+        else:
+            filename += self.extension
+
+        with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+            buffer = []
+            for calendar_name, aggregate in reports:
+                hours, attendee_ids = aggregate()
+                for record in iter_report_records(calendar_name, hours, attendee_ids, attendees_dict):
+                    buffer.append(record)
+                    if len(buffer) >= self.row_group_size:
+                        writer.write_table(pyarrow.Table.from_pylist([dict(zip(schema.names, r)) for r in buffer], schema=schema))
+                        buffer = []
+            if buffer:
+                writer.write_table(pyarrow.Table.from_pylist([dict(zip(schema.names, r)) for r in buffer], schema=schema))
+        return filename
+
+
+REPORT_WRITERS = {
+    'xlsx': XlsxReportWriter,
+    'csv': CsvReportWriter,
+    'md': MarkdownReportWriter,
+    'parquet': ParquetReportWriter,
+}
+
+
+def generate_report(output_format, calendars_events, filename, year=None, month=None, start_date=None, end_date=None, attendees_catalog=None, time_zone='UTC', append=False):
+    """Writes attendees occupation report of calendars
+    calendars_events:   maps calendar name to its events list
+    filename:           report file name, without extension
+    """
+
+    if attendees_catalog is not None:
+        attendees_dict = load_attendees(attendees_catalog)
+    else:
+        attendees_dict = {}
+
+    writer = REPORT_WRITERS[output_format]()
+    if append and not writer.supports_append:
+        print('WARNING: {} reports can not be appended, {} will be overwritten.'.format(output_format, writer.output_name(filename)))
+        append = False
+
+    reports = [(calendar_name, partial(report_hours, event_list, year, month, start_date, end_date, time_zone)) for calendar_name, event_list in calendars_events.items()]
+
+    print('Generating report {}: {}'.format(report_period(year, month, start_date, end_date), writer.output_name(filename, append)))
+    with profiler.phase('report.write'):
+        writer.write(filename, reports, attendees_dict, append=append)
+    print('Report generation complete.')
@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+
+from gcaltools import jobs, profiler
+from gcaltools.config import BATCH_MAX_SIZE, API_RATE, API_MIN_RATE, API_MAX_RATE, API_RATE_STEP, API_BURST, API_THROTTLE_WINDOW, API_MAX_ATTEMPTS, API_RETRY_DELAY, API_MAX_RETRY_DELAY
+
+
+def is_throttle_error(error) -> bool:
+    """Return True if API error means requests are sent too fast (rate limit exceeded)"""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status == 403:
+        details = '{} {}'.format(getattr(error, 'reason', ''), getattr(error, 'error_details', ''))
+        return 'ratelimitexceeded' in details.lower().replace(' ', '')
+    return status == 429
+
+
+def is_transient_error(error) -> bool:
+    """Return True if API error is worth retrying (rate limit or server side error)"""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return is_throttle_error(error) or status in (500, 502, 503, 504)
+
+
+def request_cost(request) -> int:
+    """Quota units used by an API request: batches count each of their sub-requests"""
+    sub_requests = getattr(request, '_requests', None)
+    return len(sub_requests) if sub_requests else 1
+
+
+class RequestScheduler:
+    """Sends API requests within the Calendar API quota, as fast as it allows
+    rate:           token bucket of requests per second (burst: bucket size), batch sub-requests included
+    concurrency:    requests in flight at once, up to the HTTP transports pool size
+    batch_size:     sub-requests per batch request, up to BATCH_MAX_SIZE
+    All are adapted AIMD style: halved when the API throttles, raised a little after each success.
+    Transient errors (rate limit, server errors, network errors) are retried with jittered exponential
+    backoff: gcaltools requests are idempotent, inserts carry a client side event id.
+    """
+
+    def __init__(self, http_pool, rate: float = API_RATE, burst: int = API_BURST, max_attempts: int = API_MAX_ATTEMPTS) -> None:
+        self.http_pool = http_pool
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.max_concurrency = http_pool.size
+        self.concurrency = float(self.max_concurrency)
+        self.batch_size = BATCH_MAX_SIZE
+        self.throttled = 0
+        self.retries = 0
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._slowed_down = 0.0
+        self._active = 0
+        self._random = random.Random()
+        self._condition = threading.Condition()
+
+    def __acquire_tokens(self, cost: int, batch: bool = False) -> int:
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                size = min(min(cost, self.batch_size) if batch else cost, self.burst)
+                if self._tokens >= size:
+                    self._tokens -= size
+                    return size
+                wait = (size - self._tokens) / self.rate
+            # Slow rates wait long: cancelled jobs stop waiting within a second
+            time.sleep(min(wait, 1))
+            jobs.check_cancelled()
+
+    def acquire_batch(self, pending: int) -> int:
+        """Waits until a batch of up to pending sub-requests fits in the rate limit, returns its size
+        Batches are cut once admitted, so that their size follows throttling of the batches sent meanwhile:
+        send them with execute(prepaid=True).
+        """
+        return self.__acquire_tokens(pending, batch=True)
+
+    def __acquire_slot(self) -> None:
+        with self._condition:
+            while self._active >= int(self.concurrency):
+                self._condition.wait()
+            self._active += 1
+
+    def __release_slot(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def succeeded(self, cost: int = 1, started: float = None) -> None:
+        """Additive increase of concurrency (about one more request in flight per round), rate and batch size
+        Requests started before the last slow down (ie: batches with throttled sub-requests) change nothing.
+        """
+        with self._condition:
+            if started is not None and started <= self._slowed_down:
+                return
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.rate = min(API_MAX_RATE, self.rate + API_RATE_STEP * cost)
+            self.batch_size = min(BATCH_MAX_SIZE, self.batch_size + 1)
+            self._condition.notify_all()
+
+    def throttle(self) -> None:
+        """Multiplicative decrease of concurrency, rate and batch size, once for requests throttled together"""
+        with self._condition:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._slowed_down < API_THROTTLE_WINDOW:
+                return
+            self._slowed_down = now
+            self.concurrency = max(1.0, self.concurrency / 2)
+            self.rate = max(API_MIN_RATE, self.rate / 2)
+            self.batch_size = max(1, self.batch_size // 2)
+            # Requests already granted used the quota the API refused
+            self._tokens = min(self._tokens, 0.0)
+
+    def backoff(self, retry: int, error=None) -> float:
+        """Returns delay (seconds) before given retry (0 for the first one), Retry-After if the API sent one"""
+        retry_after = getattr(getattr(error, 'resp', None), 'get', lambda key: None)('retry-after')
+        if retry_after is not None and str(retry_after).isdigit():
+            return float(retry_after)
+        # Full jitter: concurrent clients retrying at once spread their retries
+        return self._random.uniform(0, min(API_MAX_RETRY_DELAY, API_RETRY_DELAY * 2 ** retry))
+
+    def execute(self, request, duplicate_ok: bool = False, prepaid: bool = False):
+        """Execute API request on a transport borrowed from the pool, retrying transient errors
+        duplicate_ok:   on a retry, 409 (duplicate id) means a previous attempt succeeded: returns None
+        prepaid:        quota of the first attempt was already acquired (see acquire_batch)
+        """
+        cost = request_cost(request)
+        for attempt in range(self.max_attempts):
+            if attempt > 0:
+                jobs.check_cancelled()
+            if attempt > 0 or not prepaid:
+                self.__acquire_tokens(cost)
+            self.__acquire_slot()
+            started = time.monotonic()
+            try:
+                with self.http_pool.connection() as http:
+                    response = request.execute(http=http)
+            except Exception as error:
+                status = getattr(getattr(error, 'resp', None), 'status', None)
+                if attempt > 0 and duplicate_ok and status == 409:
+                    return None
+                if is_throttle_error(error):
+                    self.throttle()
+                # Timeouts and dropped connections are retried too, unlike unknown hosts
+                if not (is_transient_error(error) or isinstance(error, OSError)) or attempt == self.max_attempts - 1:
+                    raise
+                failure = error
+            else:
+                self.succeeded(cost, started)
+                return response
+            finally:
+                self.__release_slot()
+
+            with self._condition:
+                self.retries += 1
+            profiler.record_retry(profiler.method_name(request))
+            time.sleep(self.backoff(attempt, failure))
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+from pytz import timezone
+
+
+def merge_intervals(intervals) -> list:
+    """Returns sorted, non overlapping union of (start, end) intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def candidate_slots(first_day: datetime, last_day: datetime, start_times: list, duration: int, time_zone: str, weekdays=range(5)):
+    """Yield (start, end) timezone aware slots of each day from first_day to last_day (included), sorted by start"""
+    tz = timezone(time_zone)
+    start_times = sorted(start_times, key=lambda t: (t.hour, t.minute))
+    day = first_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= last_day:
+        if day.weekday() in weekdays:
+            for start_time in start_times:
+                start = tz.localize(day + timedelta(hours=start_time.hour, minutes=start_time.minute))
+                yield start, start + timedelta(minutes=duration)
+        day += timedelta(days=1)
+
+
+def free_slots(busy: dict, candidates, count: int) -> list:
+    """Returns the first count candidate slots during which nobody is busy
+    busy:       {email: [(start, end), ...]}
+    candidates: (start, end) slots sorted by start
+    Busy lists of all attendees are merged once, candidates are then checked in a single forward pass.
+    """
+    merged = merge_intervals(interval for intervals in busy.values() for interval in intervals)
+    slots = []
+    index = 0
+    for start, end in candidates:
+        # Busy intervals ending before this slot can not overlap the next ones either
+        while index < len(merged) and merged[index][1] <= start:
+            index += 1
+        if index < len(merged) and merged[index][0] < end:
+            continue
+        slots.append((start, end))
+        if len(slots) >= count:
+            break
+    return slots
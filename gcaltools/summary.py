@@ -0,0 +1,212 @@
+from bisect import bisect_right
+from datetime import timedelta
+
+from pytz import timezone
+
+from gcaltools.config import PERIODS, SUMMARY_BUCKETS, SUMMARY_METRICS
+from gcaltools.events import ATTENDEES, Color
+
+# Start of each period in minutes since midnight, periods are identified by their index
+PERIOD_STARTS = sorted(int(p[:2]) * 60 + int(p[3:]) for p in PERIODS.values())
+
+METRICS = {}
+
+
+def register_metric(name: str):
+    """Class decorator making a metric available to summaries under given name, listed in SUMMARY_METRICS"""
+    if name not in SUMMARY_METRICS:
+        raise ValueError('metric {} is missing from SUMMARY_METRICS'.format(name))
+
+    def register(metric_class):
+        METRICS[name] = metric_class
+        return metric_class
+    return register
+
+
+def event_slots(event, time_zone) -> list:
+    """Returns (date, period index) slots covered by event
+    Timed events fill the period they start in, all day events fill every period of each of their days.
+    """
+    start = event.start.astimezone(time_zone)
+    if not event.all_day:
+        return [(start.date(), max(0, bisect_right(PERIOD_STARTS, start.hour * 60 + start.minute) - 1))]
+    slots = []
+    day = start.date()
+    while day < event.end.astimezone(time_zone).date():
+        slots += [(day, period) for period in range(len(PERIOD_STARTS))]
+        day += timedelta(days=1)
+    return slots
+
+
+class Metric:
+    """Summary figures accumulated event by event, slots are (calendar, date, period index)
+    Partial metrics of the same kind, computed over other events, are combined with merge.
+    """
+
+    def add(self, event, slots: list) -> None:
+        raise NotImplementedError
+
+    def merge(self, other) -> None:
+        raise NotImplementedError
+
+    def results(self) -> dict:
+        """Returns {label: value}"""
+        raise NotImplementedError
+
+
+@register_metric('days')
+class TrainingDays(Metric):
+    """Days counted as distinct (calendar, date, period) slots over the number of periods per day
+    Graphite events are not training days, but still count as trained when they have attendees.
+    """
+
+    def __init__(self) -> None:
+        self.with_trainer = set()
+        self.without_trainer = set()
+        self.total = set()
+
+    def add(self, event, slots):
+        if event.attendees:
+            self.with_trainer.update(slots)
+        if event.color != Color.GRAPHITE:
+            self.total.update(slots)
+            if not event.attendees:
+                self.without_trainer.update(slots)
+
+    def merge(self, other):
+        self.with_trainer |= other.with_trainer
+        self.without_trainer |= other.without_trainer
+        self.total |= other.total
+
+    def results(self):
+        return {
+            'Training days with trainer': len(self.with_trainer) / len(PERIOD_STARTS),
+            'Training days without trainer': len(self.without_trainer) / len(PERIOD_STARTS),
+            'Total training days': len(self.total) / len(PERIOD_STARTS),
+        }
+
+
+@register_metric('attendees')
+class HoursPerAttendee(Metric):
+    """Hours of timed events per attendee"""
+
+    def __init__(self) -> None:
+        self.hours = {}
+
+    def add(self, event, slots):
+        if event.all_day:
+            return
+        hours = (event.end - event.start).total_seconds() / 3600
+        for attendee in event.attendees:
+            self.hours[attendee] = self.hours.get(attendee, 0) + hours
+
+    def merge(self, other):
+        for attendee, hours in other.hours.items():
+            self.hours[attendee] = self.hours.get(attendee, 0) + hours
+
+    def results(self):
+        return {'Hours {}'.format(ATTENDEES.email(attendee)): round(hours, 2) for attendee, hours in self.hours.items()}
+
+
+@register_metric('colors')
+class EventsPerColor(Metric):
+    """Events count per color"""
+
+    def __init__(self) -> None:
+        self.counts = {}
+
+    def add(self, event, slots):
+        self.counts[event.color] = self.counts.get(event.color, 0) + 1
+
+    def merge(self, other):
+        for color, count in other.counts.items():
+            self.counts[color] = self.counts.get(color, 0) + count
+
+    def results(self):
+        return {'Events {}'.format(color.name.lower() if color is not None else 'default'): count for color, count in self.counts.items()}
+
+
+@register_metric('titles')
+class DaysPerTitle(Metric):
+    """Days per event title, counted like training days"""
+
+    def __init__(self) -> None:
+        self.slots = {}
+
+    def add(self, event, slots):
+        self.slots.setdefault(event.summary, set()).update(slots)
+
+    def merge(self, other):
+        for title, slots in other.slots.items():
+            self.slots.setdefault(title, set()).update(slots)
+
+    def results(self):
+        return {'Days {}'.format(title): len(slots) / len(PERIOD_STARTS) for title, slots in self.slots.items()}
+
+
+def week_bucket(day) -> str:
+    year, week, _ = day.isocalendar()
+    return '{}-W{:02d}'.format(year, week)
+
+
+def month_bucket(day) -> str:
+    return '{}-{:02d}'.format(day.year, day.month)
+
+
+BUCKETS = {
+    'week': week_bucket,
+    'month': month_bucket,
+}
+
+# The command line parser offers names from config
+if set(METRICS) != set(SUMMARY_METRICS) or set(BUCKETS) != set(SUMMARY_BUCKETS):
+    raise ImportError('summary metrics {} and buckets {} differ from SUMMARY_METRICS and SUMMARY_BUCKETS'.format(sorted(METRICS), sorted(BUCKETS)))
+
+
+class Summary:
+    """Registered metrics computed in a single pass over events, optionally per week or month
+    Summaries with the same metrics and bucketing can be merged, ie: one per calendar or per period chunk.
+    calendar:   slots are counted per calendar, merged summaries of other calendars add up their days
+                while chunks of the same calendar still count a day once
+    """
+
+    def __init__(self, metrics: list, time_zone: str, bucket: str = None, calendar: str = None) -> None:
+        self.metrics = list(metrics)
+        self.time_zone = timezone(time_zone)
+        self.bucket = bucket
+        self.calendar = calendar
+        self._bucket_key = BUCKETS[bucket] if bucket is not None else None
+        self.buckets = {}
+
+    def __bucket_metrics(self, key) -> dict:
+        metrics = self.buckets.get(key)
+        if metrics is None:
+            metrics = self.buckets[key] = {name: METRICS[name]() for name in self.metrics}
+        return metrics
+
+    def add(self, event) -> None:
+        slots = [(self.calendar,) + slot for slot in event_slots(event, self.time_zone)]
+        key = self._bucket_key(event.start.astimezone(self.time_zone).date()) if self._bucket_key is not None else None
+        for metric in self.__bucket_metrics(key).values():
+            metric.add(event, slots)
+
+    def add_events(self, event_list):
+        for event in event_list:
+            self.add(event)
+        return self
+
+    def merge(self, other) -> None:
+        for key, metrics in other.buckets.items():
+            for name, metric in self.__bucket_metrics(key).items():
+                metric.merge(metrics[name])
+
+    def results(self) -> dict:
+        """Returns {bucket: {label: value}} sorted by bucket, bucket is None without bucketing"""
+        if not self.buckets:
+            self.__bucket_metrics(None)
+        results = {}
+        for key in sorted(self.buckets, key=lambda k: '' if k is None else k):
+            results[key] = {}
+            for metric in self.buckets[key].values():
+                results[key].update(metric.results())
+        return results
@@ -0,0 +1,123 @@
+import queue
+import threading
+import zlib
+from contextlib import contextmanager
+
+import httplib2
+
+from gcaltools import profiler
+from gcaltools.config import HTTP_POOL_SIZE, HTTP_TIMEOUT
+
+
+def _force_encoding(http, gzip: bool):
+    """Wraps http.request to ask for gzip encoded responses, or for uncompressed ones"""
+    request = http.request
+
+    def encoded_request(uri, method="GET", body=None, headers=None, *args, **kwargs):
+        headers = dict(headers) if headers is not None else {}
+        if gzip:
+            # Google APIs only compress responses for user agents containing "gzip"
+            headers['accept-encoding'] = 'gzip'
+            if 'gzip' not in headers.get('user-agent', ''):
+                headers['user-agent'] = (headers.get('user-agent', '') + ' (gzip)').strip()
+        else:
+            headers['accept-encoding'] = 'identity'
+        return request(uri, method, body, headers, *args, **kwargs)
+
+    http.request = encoded_request
+    return http
+
+
+class TrafficStats:
+    """Counts API responses and their size, for debugging
+    httplib2 decompresses responses before returning them: the gzip size on the wire is estimated
+    by compressing the payload again, only while statistics are collected.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.responses = 0
+        self.cached = 0
+        self.payload_bytes = 0
+        self.wire_bytes = 0
+
+    def record(self, response, content) -> None:
+        payload_bytes = len(content) if content else 0
+        if response.fromcache:
+            wire_bytes = 0
+        elif response.get('-content-encoding') == 'gzip':
+            wire_bytes = len(zlib.compress(content)) if content else 0
+        else:
+            wire_bytes = payload_bytes
+        with self._lock:
+            self.responses += 1
+            self.cached += response.fromcache
+            self.payload_bytes += payload_bytes
+            self.wire_bytes += wire_bytes
+
+    def wrap(self, http):
+        """Wraps http.request to record each response"""
+        request = http.request
+
+        def recorded_request(*args, **kwargs):
+            response, content = request(*args, **kwargs)
+            self.record(response, content)
+            return response, content
+
+        http.request = recorded_request
+        return http
+
+
+class HttpPool:
+    """Pool of authorized keep-alive HTTP transports shared by worker threads
+    httplib2.Http objects are not thread-safe: each one is handed to a single thread at a time
+    and keeps its TLS connections open between requests. All transports share the same credentials.
+    """
+
+    def __init__(self, credentials, size: int = HTTP_POOL_SIZE, timeout: int = HTTP_TIMEOUT, gzip: bool = True, cache=None, traffic: TrafficStats = None) -> None:
+        self._credentials = credentials
+        self.size = size
+        self.timeout = timeout
+        self.gzip = gzip
+        self._cache = cache
+        self._traffic = traffic
+        # LIFO: the most recently used transport has the warmest connections
+        self._idle = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(size)
+
+    def __new_http(self):
+        http = httplib2.Http(timeout=self.timeout, cache=self._cache)
+        # 308 are used by Google APIs for resumable uploads, not as redirects
+        http.redirect_codes = http.redirect_codes - {308}
+        if self._traffic is not None:
+            self._traffic.wrap(http)
+        profiler.wrap_http(http)
+        return self._credentials.authorize(_force_encoding(http, self.gzip))
+
+    @contextmanager
+    def connection(self):
+        """Borrow an authorized transport, blocks while all transports are in use"""
+        self._available.acquire()
+        try:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = self.__new_http()
+            try:
+                yield http
+            finally:
+                self._idle.put(http)
+        finally:
+            self._available.release()
+
+    def close(self) -> None:
+        """Close idle connections"""
+        while True:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            http.close()
@@ -1,3 +1,4 @@
+import os
 from gcaltools.config import DATE_FORMAT
 from datetime import datetime, timedelta
 
@@ -13,3 +14,48 @@ def today_date():
 
 def next_date():
     return (datetime.now() + timedelta(days=6)).strftime(DATE_FORMAT)
+
+
+class YamlFile:
+    """YAML file kept in memory, parsed again only when its modification time or size changes
+    loader: yaml Loader class (default: yaml.FullLoader), yaml is only imported to read or write the file
+    """
+
+    def __init__(self, file_path: str, loader=None) -> None:
+        self.file_path = file_path
+        self.loader = loader
+        self._stamp = None
+        self._data = None
+
+    def __current_stamp(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def exists(self) -> bool:
+        return self.__current_stamp() is not None
+
+    def changed(self) -> bool:
+        """Return True if file was written, created or removed since it was last loaded or saved"""
+        return self.__current_stamp() != self._stamp
+
+    def load(self, default=None):
+        """Returns parsed file content, default if the file does not exist or is empty"""
+        stamp = self.__current_stamp()
+        if stamp is None:
+            self._stamp = self._data = None
+        elif stamp != self._stamp:
+            import yaml
+            with open(self.file_path) as file:
+                self._data = yaml.load(file, Loader=self.loader or yaml.FullLoader)
+            self._stamp = stamp
+        return self._data if self._data is not None else default
+
+    def save(self, data) -> None:
+        import yaml
+        with open(self.file_path, 'w') as file:
+            yaml.dump(data, file, Dumper=yaml.Dumper)
+        self._data = data
+        self._stamp = self.__current_stamp()
@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+"""Import-time budget check for gcaltools subcommands
+
+Runs each subcommand for real with `python -X importtime`, and fails when the
+cumulative time of the imports it triggers (gcaltools modules and the libraries
+they load, lazy imports included) exceeds the subcommand budget.
+
+Commands run with a temporary HOME holding stub preferences, against the local
+fake Calendar API (see benchmarks/fake_calendar_server.py): no Google account needed.
+
+usage: python scripts/check_importtime.py [--scale FACTOR] [--runs N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+import yaml  # noqa: E402
+
+from fake_calendar_server import FakeCalendarApi, serve, synthetic_calendars  # noqa: E402
+
+# Entry point of the gcaltools console script
+MAIN = 'import sys; sys.argv[0] = "gcaltools"; from gcaltools.gcaltools import main; main()'
+
+# subcommand: (command line, standard input, budget in milliseconds)
+BUDGETS = {
+    'help': (['--help'], None, 60),
+    'default': (['default'], None, 100),
+    'template': (['template', 'list'], None, 100),
+    'cache': (['cache', 'stats'], None, 100),
+    'list': (['list'], None, 450),
+    'show': (['show', '-w'], None, 450),
+    'summary': (['summary'], None, 450),
+    'report': (['report'], None, 450),
+    'add': (['add', '-t', 'Import time check', '-s', 'am', '2030-01-07'], None, 450),
+    # The prompt prefetches the current week and month: the API client is loaded in the background
+    'interactive': (['-i'], 'quit\n', 450),
+}
+
+
+def import_time(argv: list, stdin: str, env: dict, cwd: str) -> float:
+    """Returns cumulative import time (ms) of a gcaltools command line run in a fresh interpreter"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', MAIN] + argv, input=stdin, env=env, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError('gcaltools {} failed: {}'.format(' '.join(argv), result.stderr.strip().splitlines()[-1:]))
+    total_us = 0
+    started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Interpreter startup imports come before the entry point
+        started = started or name.strip().startswith('gcaltools')
+        # Only top level imports, their cumulative time includes nested ones
+        if started and not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+def command_environment(home: str, api_root: str) -> dict:
+    """Returns environment of commands: stub preferences in home, requests sent to the fake API"""
+    os.makedirs(os.path.join(home, '.gcaltools'))
+    with open(os.path.join(home, '.gcaltools', '.defaults'), 'w') as defaults_file:
+        yaml.dump({'default_calendar': 'Calendar 0', 'default_duration': 60, 'default_timezone': 'Europe/Brussels', 'attendees_catalog': None}, defaults_file)
+    env = dict(os.environ, HOME=home, GCALTOOLS_API_ROOT=api_root, PYTHONPATH=ROOT_DIR)
+    env.pop('GCALTOOLS_USE_DAEMON', None)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check gcaltools subcommands import time against their budget")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply all budgets (slow machines, CI)")
+    parser.add_argument('--runs', type=int, default=3, help="Keep best of N runs")
+    args = parser.parse_args()
+
+    server = serve(FakeCalendarApi(synthetic_calendars(1, 200, 10, 0)), port=0)
+    failures = 0
+    try:
+        with tempfile.TemporaryDirectory(prefix='gcaltools-importtime-') as work_dir:
+            env = command_environment(os.path.join(work_dir, 'home'), 'http://127.0.0.1:{}/'.format(server.server_address[1]))
+            for command, (argv, stdin, budget) in BUDGETS.items():
+                measured = min(import_time(argv, stdin, env, work_dir) for _ in range(args.runs))
+                allowed = budget * args.scale
+                status = 'OK' if measured <= allowed else 'OVER BUDGET'
+                if measured > allowed:
+                    failures += 1
+                print('{:<12} {:>8.1f} ms / {:>6.1f} ms  {}'.format(command, measured, allowed, status))
+    finally:
+        server.shutdown()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()